@@ -1,113 +1,321 @@
 from models.db import get_db
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
+from ai.cache import LRUCache
+from ai.singleflight import ai_requests
+from models.charging import HOUR_FORMAT, get_station_version
 
 logger = logging.getLogger(__name__)
 
+# Summaries are cached per station with the station's data version; a newer
+# version or an entry older than ANALYTICS_MAX_AGE is served stale once while
+# a single background refresh rebuilds it
+ANALYTICS_MAX_AGE = 15 * 60
+PRICE_TREND_DAYS = 30
+# The batch runs nightly; older forecasts are treated as missing
+FORECAST_MAX_AGE = timedelta(hours=36)
+_summary_cache = LRUCache(max_entries=500)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
 
-def get_peak_hours(station_name):
+
+def _load_station_activity(cur, station_name, now=None):
     """
-    Predict peak charging hours for a station based on historical data
-    Returns: List of hours (0-23) and their activity levels
+    One pass over a station's hourly rollup rows for every analytics view
+    Returns: dict with station info, hour/weekday histograms, 30-day unit price
+    and duration stats, or None if the station does not exist
+    """
+    # hour_bucket is UTC, like the CURRENT_TIMESTAMP it is derived from
+    now = now or datetime.utcnow()
+    # Same text format as session_rollup_hourly.hour_bucket
+    thirty_days_ago = (now - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    sixty_days_ago = (now - timedelta(days=60)).strftime("%Y-%m-%d %H:%M:%S")
+
+    cur.execute("""
+        SELECT price, chargers, green_score FROM stations WHERE name = ?
+    """, (station_name,))
+    station = cur.fetchone()
+    if not station:
+        return None
+
+    # At most 24 x 7 groups; each window is a conditional aggregate, so the
+    # 30/60-day histograms, unit price and duration share one range scan
+    cur.execute("""
+        SELECT CAST(strftime('%H', hour_bucket) AS INTEGER) AS hour,
+               (CAST(strftime('%w', hour_bucket) AS INTEGER) + 6) % 7 AS weekday,
+               SUM(CASE WHEN hour_bucket >= ? THEN sessions ELSE 0 END),
+               SUM(CASE WHEN hour_bucket >= ? THEN sessions ELSE 0 END),
+               SUM(CASE WHEN hour_bucket >= ? THEN revenue ELSE 0 END),
+               SUM(CASE WHEN hour_bucket >= ? THEN units ELSE 0 END),
+               SUM(CASE WHEN hour_bucket >= ? THEN duration_minutes ELSE 0 END),
+               SUM(CASE WHEN hour_bucket >= ? THEN timed_sessions ELSE 0 END)
+        FROM session_rollup_hourly
+        WHERE station_name = ? AND hour_bucket >= ?
+        GROUP BY hour, weekday
+    """, (thirty_days_ago, sixty_days_ago, thirty_days_ago, thirty_days_ago, thirty_days_ago, thirty_days_ago,
+          station_name, sixty_days_ago))
+
+    hour_counts = [0] * 24
+    weekday_counts = [0] * 7
+    revenue_30d, units_30d = 0.0, 0.0
+    duration_sum, duration_count = 0, 0
+
+    for hour, weekday, count_30d, count_60d, revenue, units, dur_sum, dur_count in cur.fetchall():
+        hour_counts[hour] += count_30d
+        weekday_counts[weekday] += count_60d
+        revenue_30d += revenue or 0
+        units_30d += units or 0
+        duration_sum += dur_sum or 0
+        duration_count += dur_count or 0
+
+    price, chargers, green_score = station
+    return {
+        "price": price,
+        "chargers": chargers,
+        "green_score": green_score,
+        "hour_counts": hour_counts,
+        "weekday_counts": weekday_counts,
+        # Energy-weighted: revenue per kWh billed over the window
+        "avg_unit_price_30d": revenue_30d / units_30d if units_30d > 0 else None,
+        "avg_duration": duration_sum / duration_count if duration_count else None,
+        "sessions_30d": sum(hour_counts)
+    }
+
+
+def _load_stored_forecast(cur, station_name, days_ahead=7, now=None):
+    """
+    Daily demand forecast from the batch in ai/forecasting.py for the
+    days_ahead full UTC days starting at the next midnight
+    Returns: list of day dicts, or None when the batch is older than
+    FORECAST_MAX_AGE or does not cover every hour of those days
+    Daily bounds are sums of hourly bounds, so they err on the wide side
     """
+    # Forecast buckets are UTC hours, so whole days are UTC days
+    now = now or datetime.utcnow()
+    start = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    end = start + timedelta(days=days_ahead)
+
+    cur.execute("""
+        SELECT date(hour_bucket), COUNT(*), SUM(expected), SUM(lower), SUM(upper), MIN(model), MIN(generated_at)
+        FROM station_forecasts
+        WHERE station_name = ? AND hour_bucket >= ? AND hour_bucket < ?
+        GROUP BY date(hour_bucket)
+        ORDER BY date(hour_bucket)
+    """, (station_name, start.strftime(HOUR_FORMAT), end.strftime(HOUR_FORMAT)))
+    rows = cur.fetchall()
+
+    # A stale or short batch run falls back to the weekday histogram rather
+    # than serving fewer days
+    fresh_after = (now - FORECAST_MAX_AGE).strftime("%Y-%m-%d %H:%M:%S")
+    if len(rows) < days_ahead:
+        return None
+    if any(hours < 24 or not generated_at or generated_at < fresh_after for _, hours, *_, generated_at in rows):
+        return None
+
+    forecast = []
+    for day, _, expected, lower, upper, model, _ in rows:
+        demand = round(expected, 1)
+        forecast.append({
+            "date": day,
+            "day": datetime.strptime(day, "%Y-%m-%d").strftime("%A"),
+            "expected_sessions": demand,
+            "lower": round(lower, 1),
+            "upper": round(upper, 1),
+            "model": model,
+            "confidence": "high" if demand > 5 else "medium" if demand > 0 else "low"
+        })
+    return forecast
+
+
+def _build_peak_hours(activity):
+    hour_counts = activity["hour_counts"]
+    total = sum(hour_counts)
+    if total == 0:
+        return None
+
+    busiest = max(hour_counts)
+
+    # Return hours with intensity (0-10 scale)
+    hours_data = []
+    for hour, count in enumerate(hour_counts):
+        intensity = min(10, int((count / busiest) * 10)) if busiest > 0 else 0
+        hours_data.append({
+            "hour": f"{hour:02d}:00",
+            "count": count,
+            "intensity": intensity,
+            "is_peak": count > (total / 12)  # Peak if above average
+        })
+
+    return hours_data
+
+
+def _build_demand_forecast(activity, days_ahead=7, now=None):
+    weekday_counts = activity["weekday_counts"]
+    # Weekdays come from UTC hour buckets, so count days in UTC too; the
+    # days match the stored forecast's, starting tomorrow
+    tomorrow = (now or datetime.utcnow()) + timedelta(days=1)
+
+    forecast = []
+    for i in range(days_ahead):
+        future_date = tomorrow + timedelta(days=i)
+        demand = weekday_counts[future_date.weekday()]
+
+        forecast.append({
+            "date": future_date.strftime("%Y-%m-%d"),
+            "day": future_date.strftime("%A"),
+            "expected_sessions": demand,
+            "confidence": "high" if demand > 5 else "medium" if demand > 0 else "low"
+        })
+
+    return forecast
+
+
+def _load_price_history(cur, station_name, days=PRICE_TREND_DAYS, now=None):
+    """
+    Recorded price changes for a station over the last N days
+    Returns: (price in effect when the window opens or None, [(changed_at, price), ...])
+    """
+    # Price history is stamped with CURRENT_TIMESTAMP (UTC)
+    now = now or datetime.utcnow()
+    start = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    cur.execute("""
+        SELECT price FROM station_price_history
+        WHERE station_name = ? AND changed_at < ?
+        ORDER BY changed_at DESC, id DESC
+        LIMIT 1
+    """, (station_name, start))
+    row = cur.fetchone()
+    opening_price = row[0] if row else None
+
+    cur.execute("""
+        SELECT changed_at, price FROM station_price_history
+        WHERE station_name = ? AND changed_at >= ?
+        ORDER BY changed_at, id
+    """, (station_name, start))
+    return opening_price, cur.fetchall()
+
+
+def _daily_prices(opening_price, changes, days=PRICE_TREND_DAYS, now=None):
+    """Price in effect at the end of each day, oldest first; days before any known price are skipped"""
+    today = (now or datetime.utcnow()).date()
+    price = opening_price
+    series = []
+    i = 0
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        day_end = (day + timedelta(days=1)).isoformat()
+        while i < len(changes) and str(changes[i][0]) < day_end:
+            price = changes[i][1]
+            i += 1
+        if price is not None:
+            series.append({"date": day.isoformat(), "price": price})
+    return series
+
+
+def _build_price_trend(activity, price_history=None, days=PRICE_TREND_DAYS):
+    current_price = activity["price"]
+    opening_price, changes = price_history or (None, [])
+
+    if opening_price is None and not changes:
+        # No recorded prices yet: compare with what sessions actually paid
+        historical_avg = activity["avg_unit_price_30d"] or current_price
+        ma_7 = None
+        series = []
+        change_points = []
+    else:
+        series = _daily_prices(opening_price, changes, days)
+        prices = [point["price"] for point in series] or [current_price]
+        historical_avg = sum(prices) / len(prices)
+        ma_7 = round(sum(prices[-7:]) / len(prices[-7:]), 2)
+
+        change_points = []
+        previous = opening_price
+        for changed_at, price in changes:
+            if previous:
+                change_points.append({
+                    "date": str(changed_at)[:10],
+                    "from": previous,
+                    "to": price,
+                    "change_pct": round((price - previous) / previous * 100, 1)
+                })
+            previous = price
+        change_points = change_points[-5:][::-1]
+
+    trend = "stable"
+    if current_price > historical_avg * 1.1:
+        trend = "increasing"
+    elif current_price < historical_avg * 0.9:
+        trend = "decreasing"
+
+    return {
+        "current_price": round(current_price, 2),
+        "historical_avg": round(historical_avg, 2),
+        "moving_avg_7d": ma_7,
+        "trend": trend,
+        "changes": change_points,
+        "series": series,
+        "recommendation": "Consider charging soon - prices are low!" if trend == "decreasing" else "Prices may increase soon" if trend == "increasing" else "Prices are stable"
+    }
+
+
+def _build_efficiency_metrics(activity):
+    avg_duration = activity["avg_duration"] or 0
+    total_sessions = activity["sessions_30d"]
+    chargers = activity["chargers"]
+    green_score = activity["green_score"]
+
+    return {
+        "avg_charging_time_minutes": round(avg_duration, 1) if avg_duration > 0 else "N/A",
+        "total_sessions_30d": total_sessions,
+        "available_chargers": chargers,
+        "green_score": green_score,
+        "efficiency_rating": "Excellent" if avg_duration < 60 and green_score >= 8 else "Good" if avg_duration < 90 and green_score >= 6 else "Standard",
+        "recommendation": "Fast and eco-friendly!" if avg_duration < 60 and green_score >= 8 else "Reliable option" if total_sessions > 50 else "Growing station"
+    }
+
+
+def _with_activity(station_name, build, error_label):
     conn = get_db()
     cur = conn.cursor()
-    
+
     try:
-        # Get charging sessions from last 30 days
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-        
-        cur.execute("""
-            SELECT started_at FROM charging_sessions 
-            WHERE station_name = ? AND started_at > ?
-        """, (station_name, thirty_days_ago))
-        
-        sessions = cur.fetchall()
-        
-        # Count sessions by hour of day
-        hour_counts = [0] * 24
-        for session in sessions:
-            if session[0]:
-                try:
-                    hour = datetime.fromisoformat(session[0]).hour
-                    hour_counts[hour] += 1
-                except:
-                    pass
-        
-        # Calculate average
-        total = sum(hour_counts)
-        if total == 0:
+        activity = _load_station_activity(cur, station_name)
+        if activity is None:
             return None
-        
-        avg = total / 24
-        
-        # Return hours with intensity (0-10 scale)
-        hours_data = []
-        for hour, count in enumerate(hour_counts):
-            intensity = min(10, int((count / max(hour_counts)) * 10)) if max(hour_counts) > 0 else 0
-            hours_data.append({
-                "hour": f"{hour:02d}:00",
-                "count": count,
-                "intensity": intensity,
-                "is_peak": count > (total / 12)  # Peak if above average
-            })
-        
-        return hours_data
-        
+        return build(activity)
     except Exception as e:
-        logger.error(f"Error predicting peak hours: {e}")
+        logger.error(f"Error {error_label}: {e}")
         return None
     finally:
         conn.close()
 
 
+def get_peak_hours(station_name):
+    """
+    Predict peak charging hours for a station based on the last 30 days
+    Returns: List of hours (0-23) and their activity levels
+    """
+    return _with_activity(station_name, _build_peak_hours, "predicting peak hours")
+
+
 def get_station_demand_forecast(station_name, days_ahead=7):
     """
     Forecast demand for a station over next N days
-    Based on historical weekday patterns
+    Served from the batch forecasts; stations the batch has not covered yet,
+    or a stale batch, fall back to weekday counts of the last 60 days
     """
     conn = get_db()
     cur = conn.cursor()
-    
+
     try:
-        # Get data from last 60 days
-        sixty_days_ago = (datetime.now() - timedelta(days=60)).isoformat()
-        
-        cur.execute("""
-            SELECT started_at FROM charging_sessions 
-            WHERE station_name = ? AND started_at > ?
-        """, (station_name, sixty_days_ago))
-        
-        sessions = cur.fetchall()
-        
-        # Count by weekday (0=Monday, 6=Sunday)
-        weekday_counts = [0] * 7
-        for session in sessions:
-            if session[0]:
-                try:
-                    dt = datetime.fromisoformat(session[0])
-                    weekday_counts[dt.weekday()] += 1
-                except:
-                    pass
-        
-        # Generate forecast
-        forecast = []
-        today = datetime.now()
-        
-        for i in range(days_ahead):
-            future_date = today + timedelta(days=i)
-            weekday = future_date.weekday()
-            demand = weekday_counts[weekday]
-            
-            forecast.append({
-                "date": future_date.strftime("%Y-%m-%d"),
-                "day": future_date.strftime("%A"),
-                "expected_sessions": demand,
-                "confidence": "high" if demand > 5 else "medium" if demand > 0 else "low"
-            })
-        
-        return forecast
-        
+        forecast = _load_stored_forecast(cur, station_name, days_ahead)
+        if forecast is not None:
+            return forecast
+        activity = _load_station_activity(cur, station_name)
+        return _build_demand_forecast(activity, days_ahead) if activity else None
     except Exception as e:
         logger.error(f"Error forecasting demand: {e}")
         return None
@@ -115,50 +323,20 @@ def get_station_demand_forecast(station_name, days_ahead=7):
         conn.close()
 
 
-def get_price_trend(station_name, days=30):
+def get_price_trend(station_name, days=PRICE_TREND_DAYS):
     """
-    Analyze price trends for a station
-    Returns: Average price over time, trend direction
+    Analyze price trends for a station from its recorded price changes
+    Returns: time-weighted average over the last N days, 7-day moving average,
+    trend direction, recent changes and a daily price series for the window
     """
     conn = get_db()
     cur = conn.cursor()
-    
+
     try:
-        cur.execute("""
-            SELECT price FROM stations WHERE name = ?
-        """, (station_name,))
-        
-        result = cur.fetchone()
-        if not result:
+        activity = _load_station_activity(cur, station_name)
+        if activity is None:
             return None
-        
-        current_price = result[0]
-        
-        # Get average historical price
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-        
-        cur.execute("""
-            SELECT AVG(amount/units) as avg_price 
-            FROM charging_sessions 
-            WHERE station_name = ? AND started_at > ? AND units > 0
-        """, (station_name, thirty_days_ago))
-        
-        hist_result = cur.fetchone()
-        historical_avg = hist_result[0] if hist_result and hist_result[0] else current_price
-        
-        trend = "stable"
-        if current_price > historical_avg * 1.1:
-            trend = "increasing"
-        elif current_price < historical_avg * 0.9:
-            trend = "decreasing"
-        
-        return {
-            "current_price": round(current_price, 2),
-            "historical_avg": round(historical_avg, 2),
-            "trend": trend,
-            "recommendation": "Consider charging soon - prices are low!" if trend == "decreasing" else "Prices may increase soon" if trend == "increasing" else "Prices are stable"
-        }
-        
+        return _build_price_trend(activity, _load_price_history(cur, station_name, days), days)
     except Exception as e:
         logger.error(f"Error analyzing price trend: {e}")
         return None
@@ -171,55 +349,95 @@ def get_station_efficiency_metrics(station_name):
     Analyze station efficiency metrics
     Returns: Average charging time, throughput, ratings
     """
+    return _with_activity(station_name, _build_efficiency_metrics, "getting efficiency metrics")
+
+
+def get_all_analytics_summary(station_name):
+    """Get comprehensive analytics for a station"""
+    version = _station_version(station_name)
+    cached = _summary_cache.get(station_name)
+
+    if cached is None:
+        return _refresh_summary(station_name, version)
+
+    cached_version, computed_at, summary = cached
+    if cached_version != version or time.time() - computed_at > ANALYTICS_MAX_AGE:
+        _refresh_in_background(station_name, version)
+    return summary
+
+
+def get_analytics_cache_stats():
+    stats = _summary_cache.stats()
+    stats["refreshing"] = len(_refreshing)
+    return stats
+
+
+def _station_version(station_name):
     conn = get_db()
     cur = conn.cursor()
-    
+
     try:
-        # Get sessions with duration
-        cur.execute("""
-            SELECT AVG(duration_minutes) as avg_duration, COUNT(*) as total_sessions
-            FROM charging_sessions 
-            WHERE station_name = ? AND duration_minutes IS NOT NULL
-        """, (station_name,))
-        
-        result = cur.fetchone()
-        avg_duration = result[0] if result and result[0] else 0
-        total_sessions = result[1] if result and result[1] else 0
-        
-        # Get station info
-        cur.execute("""
-            SELECT chargers, green_score FROM stations WHERE name = ?
-        """, (station_name,))
-        
-        station_info = cur.fetchone()
-        if not station_info:
-            return None
-        
-        chargers, green_score = station_info
-        
-        metrics = {
-            "avg_charging_time_minutes": round(avg_duration, 1) if avg_duration > 0 else "N/A",
-            "total_sessions_30d": total_sessions,
-            "available_chargers": chargers,
-            "green_score": green_score,
-            "efficiency_rating": "Excellent" if avg_duration < 60 and green_score >= 8 else "Good" if avg_duration < 90 and green_score >= 6 else "Standard",
-            "recommendation": "Fast and eco-friendly!" if avg_duration < 60 and green_score >= 8 else "Reliable option" if total_sessions > 50 else "Growing station"
-        }
-        
-        return metrics
-        
+        return get_station_version(cur, station_name)
     except Exception as e:
-        logger.error(f"Error getting efficiency metrics: {e}")
+        logger.error(f"Error reading station version: {e}")
         return None
     finally:
         conn.close()
 
 
-def get_all_analytics_summary(station_name):
-    """Get comprehensive analytics for a station"""
+def _refresh_summary(station_name, version):
+    # Viewers of the same station at the same moment share one computation
+    return ai_requests.do(("analytics", station_name), _compute_and_cache, station_name, version)
+
+
+def _compute_and_cache(station_name, version):
+    summary = _compute_analytics_summary(station_name)
+    cached = _summary_cache.get(station_name)
+    # Never replace a summary built from newer data
+    if cached is None or version is None or cached[0] is None or cached[0] <= version:
+        _summary_cache.set(station_name, (version, time.time(), summary))
+    return summary
+
+
+def _refresh_in_background(station_name, version):
+    with _refreshing_lock:
+        if station_name in _refreshing:
+            return
+        _refreshing.add(station_name)
+
+    def refresh():
+        try:
+            _refresh_summary(station_name, version)
+        except Exception as e:
+            logger.error(f"Error refreshing analytics for {station_name}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(station_name)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _compute_analytics_summary(station_name):
+    # One connection and one scan of the station's rollup rows feed every section
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        activity = _load_station_activity(cur, station_name)
+        forecast = _load_stored_forecast(cur, station_name) if activity else None
+        price_history = _load_price_history(cur, station_name) if activity else None
+    except Exception as e:
+        logger.error(f"Error loading station analytics: {e}")
+        activity = None
+    finally:
+        conn.close()
+
+    if activity is None:
+        return {"peak_hours": None, "demand_forecast": None, "price_trend": None, "efficiency": None}
+
     return {
-        "peak_hours": get_peak_hours(station_name),
-        "demand_forecast": get_station_demand_forecast(station_name),
-        "price_trend": get_price_trend(station_name),
-        "efficiency": get_station_efficiency_metrics(station_name)
+        "peak_hours": _build_peak_hours(activity),
+        "demand_forecast": forecast or _build_demand_forecast(activity),
+        "price_trend": _build_price_trend(activity, price_history),
+        "efficiency": _build_efficiency_metrics(activity)
     }
@@ -1,7 +1,13 @@
-import google.genai as genai
 import os
+import re
 import logging
 from dotenv import load_dotenv
+from ai.gemini import GEMINI_MODEL, get_client
+from models.db import get_db
+from ai.fuzzy_search import find_mentioned_stations
+from ai.conversation import DIGEST_ROLE, MAX_TURNS
+from ai.intent_router import answer_from_data
+from ai.response_cache import response_cache, tokenize_message
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,7 +21,23 @@ else:
     logger.warning("⚠️ GEMINI_API_KEY not set. Chatbot will use fallback responses.")
 
 
-def chat_with_bot(user_message, conversation_history=None):
+SYSTEM_PROMPT = """You are a friendly and helpful AI assistant for a Smart EV Charging platform. You help users with:
+- Station information (location, pricing, availability, chargers)
+- Charging recommendations based on their needs
+- Troubleshooting charging issues
+- Payment and billing questions
+- Booking and queue information
+- Environmental benefits and eco-friendly choices
+- Pricing comparison and cost-saving tips
+
+Be concise, helpful, and professional. Provide actionable advice. If you don't know something specific, suggest the user contact support or check the app.
+
+Today's date: January 23, 2026."""
+
+GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 500}
+
+
+def chat_with_bot(user_message, conversation_history=None, user_id=None):
     """
     AI-powered chatbot for Smart EV Charging platform
     Handles: station info, pricing, troubleshooting, payment issues, recommendations
@@ -23,56 +45,45 @@ def chat_with_bot(user_message, conversation_history=None):
     Args:
         user_message: User's question or message
         conversation_history: List of previous messages for context [(role, message), ...]
+        user_id: Current user, lets questions about their own sessions be answered from the DB
     
     Returns:
         (response_text, is_error)
     """
     
+    # Data questions are answered straight from the database
+    data_answer = answer_from_data(user_message, user_id)
+    if data_answer:
+        return data_answer, False
+    
     if not GEMINI_API_KEY:
         logger.info("ℹ️ No Gemini API key - using fallback response")
         return _get_fallback_response(user_message), False
     
+    # Standalone questions get the same answer whoever asks, so near-duplicates reuse it,
+    # mid-conversation too; only answers written without earlier turns are stored
+    station_context = _get_station_context(user_message)
+    cacheable = _cacheable(user_message, station_context)
+    if cacheable:
+        cached = response_cache.lookup(user_message, namespace=FAQ_NAMESPACE)
+        if cached:
+            return cached, False
+    
     try:
-        system_prompt = """You are a friendly and helpful AI assistant for a Smart EV Charging platform. You help users with:
-- Station information (location, pricing, availability, chargers)
-- Charging recommendations based on their needs
-- Troubleshooting charging issues
-- Payment and billing questions
-- Booking and queue information
-- Environmental benefits and eco-friendly choices
-- Pricing comparison and cost-saving tips
-
-Be concise, helpful, and professional. Provide actionable advice. If you don't know something specific, suggest the user contact support or check the app.
-
-Today's date: January 23, 2026."""
-
-        # Build message history
-        messages = []
-        
-        # Add conversation context
-        if conversation_history:
-            for role, content in conversation_history[-10:]:  # Last 10 messages for context
-                messages.append({
-                    "role": "user" if role == "user" else "model",
-                    "parts": [{"text": content}]
-                })
-        
-        # Add current user message with system context
-        messages.append({
-            "role": "user",
-            "parts": [{"text": f"{system_prompt}\n\nUser Message: {user_message}"}]
-        })
+        messages = _build_messages(user_message, conversation_history, station_context)
         
         logger.debug(f"🔄 Sending message to Gemini API: {user_message[:50]}...")
         
-        model = genai.Client().models.get("models/gemini-2.0-flash")
-        response = model.generate_content(
-            messages,
-            generation_config={"temperature": 0.7, "max_output_tokens": 500}
+        response = get_client().models.generate_content(
+            model=GEMINI_MODEL,
+            contents=messages,
+            config=GENERATION_CONFIG
         )
         
         if response and response.text:
             logger.info("✅ Gemini API response received successfully")
+            if cacheable and not conversation_history:
+                response_cache.store(user_message, response.text, namespace=FAQ_NAMESPACE)
             return response.text, False
         else:
             logger.warning("⚠️ Gemini API returned empty response")
@@ -84,25 +95,202 @@ Today's date: January 23, 2026."""
         return _get_fallback_response(user_message), False
 
 
-def _get_fallback_response(user_message):
-    """Fallback responses when API is unavailable"""
+def stream_chat_with_bot(user_message, conversation_history=None, user_id=None):
+    """
+    Streaming variant of chat_with_bot
+    Yields response text chunks as Gemini produces them; data answers and fallback
+    responses are yielded word by word so the client handles every path the same way
+    """
     
-    message_lower = user_message.lower()
+    data_answer = answer_from_data(user_message, user_id)
+    if data_answer:
+        yield from _stream_text(data_answer)
+        return
+    
+    if not GEMINI_API_KEY:
+        logger.info("ℹ️ No Gemini API key - streaming fallback response")
+        yield from _stream_text(_get_fallback_response(user_message))
+        return
+    
+    station_context = _get_station_context(user_message)
+    cacheable = _cacheable(user_message, station_context)
+    if cacheable:
+        cached = response_cache.lookup(user_message, namespace=FAQ_NAMESPACE)
+        if cached:
+            yield from _stream_text(cached)
+            return
+    
+    chunks = []
+    try:
+        messages = _build_messages(user_message, conversation_history, station_context)
+        
+        logger.debug(f"🔄 Streaming message to Gemini API: {user_message[:50]}...")
+        
+        for chunk in get_client().models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=messages,
+            config=GENERATION_CONFIG
+        ):
+            if chunk and chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+        
+        if not chunks:
+            logger.warning("⚠️ Gemini API returned empty stream")
+            yield from _stream_text(_get_fallback_response(user_message))
+        elif cacheable and not conversation_history:
+            response_cache.store(user_message, "".join(chunks), namespace=FAQ_NAMESPACE)
+        
+    except Exception as e:
+        logger.error(f"❌ Chatbot streaming error: {str(e)}")
+        # Once tokens reached the browser we cannot swap in a different answer
+        if not chunks:
+            logger.info("📌 Falling back to keyword-based response")
+            yield from _stream_text(_get_fallback_response(user_message))
+
+
+def _build_messages(user_message, conversation_history=None, station_context=""):
+    """Gemini contents for the conversation so far plus the new message with system context"""
+    
+    system_prompt = SYSTEM_PROMPT
     
-    if any(word in message_lower for word in ["price", "cost", "expensive", "cheap"]):
-        return "Station prices vary by location and charger type. Use the 'AI Recommendations' feature to find the best-priced station for your needs. Check your charging history to see average costs!"
+    if station_context:
+        system_prompt += f"\n\nLive data for stations the user mentioned:\n{station_context}"
+    
+    # Build message history
+    messages = []
+    
+    # Add conversation context
+    if conversation_history:
+        for role, content in conversation_history[-(MAX_TURNS + 1):]:  # Recent turns plus the digest of older ones
+            if role == DIGEST_ROLE:
+                # Older turns cut to their first sentence; context, not something the user said
+                system_prompt += ("\n\nEarlier in this conversation (first sentence of each older turn, "
+                                  f"not a full record):\n{content}")
+                continue
+            messages.append({
+                "role": "user" if role == "user" else "model",
+                "parts": [{"text": content}]
+            })
+    
+    # Add current user message with system context
+    messages.append({
+        "role": "user",
+        "parts": [{"text": f"{system_prompt}\n\nUser Message: {user_message}"}]
+    })
+    
+    return messages
+
+
+def _stream_text(text):
+    """Yield already-complete text in word-sized chunks"""
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        yield word if i == 0 else " " + word
+
+
+def _get_station_context(user_message, limit=3):
+    """
+    Typo-tolerant lookup of stations named in the message
+    Returns one line of live facts per matched station, or "" when nothing matches
+    """
+    matches = find_mentioned_stations(user_message, limit=limit)
+    if not matches:
+        return ""
+    
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        placeholders = ",".join("?" * len(matches))
+        cur.execute(f"""
+            SELECT s.name, s.location, s.chargers, s.price, s.green_score,
+                   (SELECT COUNT(*) FROM charging_sessions cs
+                    WHERE cs.station_name = s.name AND cs.status = 'Active'),
+                   (SELECT COUNT(*) FROM waiting_queue w WHERE w.station_name = s.name)
+            FROM stations s
+            WHERE s.id IN ({placeholders})
+        """, [m[0] for m in matches])
+        
+        return "\n".join(
+            f"- {name} ({location}): ₹{price}/kWh, green score {green}/10, "
+            f"{active}/{chargers} chargers in use, {queued} waiting"
+            for name, location, chargers, price, green, active, queued in cur.fetchall()
+        )
+    except Exception as e:
+        logger.error(f"Error loading station context: {e}")
+        return ""
+    finally:
+        conn.close()
+
+
+# Keyword buckets for common questions: (topic, keywords, fallback answer)
+FAQ_TOPICS = [
+    ("pricing", ["price", "cost", "expensive", "cheap"],
+     "Station prices vary by location and charger type. Use the 'AI Recommendations' feature to find the best-priced station for your needs. Check your charging history to see average costs!"),
+    ("eco", ["green", "eco", "environment", "renewable"],
+     "Great question! Our stations with high green scores use renewable energy. Look for stations with 8+ green score to minimize your environmental impact. You'll see the eco-impact in your charging history!"),
+    ("availability", ["queue", "wait", "time", "available"],
+     "Station availability varies throughout the day. Visit 'My Stations' to check current queue lengths and availability. Peak hours are typically 7-9 AM and 5-7 PM."),
+    ("troubleshooting", ["problem", "issue", "error", "not working", "trouble"],
+     "I'm sorry you're experiencing issues! Please try: 1) Refresh the page, 2) Check your internet connection, 3) Try a different charger. If problems persist, please contact support@evcharging.com"),
+    ("support", ["help", "support", "assistance"],
+     "I'm here to help! I can assist with: charging recommendations, station information, pricing questions, troubleshooting, and booking help. What would you like to know?"),
+]
+
+
+# Shared answers live in one namespace; MinHash similarity decides whether an earlier question matches
+FAQ_NAMESPACE = "faq"
+MIN_FAQ_TOKENS = 3
+
+# Words that tie a message to the asker or to earlier turns ("what about that one?",
+# "is my payment done?"); such messages never share an answer with other users
+CONTEXT_WORDS = {
+    "i", "im", "ive", "me", "my", "mine", "myself", "we", "us", "our",
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "there", "he", "she",
+    "one", "ones", "same", "else", "instead", "again", "earlier", "before", "above", "previous", "said",
+}
+CONTEXT_OPENERS = ("and ", "but ", "so ", "also ", "what about ", "how about ", "then ", "ok ", "okay ")
+
+
+def _is_standalone(user_message):
+    """
+    True when the message reads the same whoever asks and whatever came before
+    Such a question can be answered from response_cache even mid-conversation
+    """
+    message = " ".join(re.findall(r"[a-z0-9']+", user_message.lower())).replace("'", "")
+    if message.startswith(CONTEXT_OPENERS) or CONTEXT_WORDS.intersection(message.split()):
+        return False
+    # Too few content words ("why?", "how long?") only make sense as a follow-up
+    return len(tokenize_message(message)) >= MIN_FAQ_TOKENS
+
+
+def _cacheable(user_message, station_context):
+    """
+    Whether response_cache may answer the message
+    Station context carries live data, so those answers are never shared
+    """
+    return not station_context and _is_standalone(user_message)
+
+
+def _get_fallback_topic(user_message):
+    """Keyword bucket for the canned fallback answer"""
     
-    elif any(word in message_lower for word in ["green", "eco", "environment", "renewable"]):
-        return "Great question! Our stations with high green scores use renewable energy. Look for stations with 8+ green score to minimize your environmental impact. You'll see the eco-impact in your charging history!"
+    message_lower = user_message.lower()
     
-    elif any(word in message_lower for word in ["queue", "wait", "time", "available"]):
-        return "Station availability varies throughout the day. Visit 'My Stations' to check current queue lengths and availability. Peak hours are typically 7-9 AM and 5-7 PM."
+    for topic, keywords, _ in FAQ_TOPICS:
+        if any(word in message_lower for word in keywords):
+            return topic
+    return None
+
+
+def _get_fallback_response(user_message):
+    """Fallback responses when API is unavailable"""
     
-    elif any(word in message_lower for word in ["problem", "issue", "error", "not working", "trouble"]):
-        return "I'm sorry you're experiencing issues! Please try: 1) Refresh the page, 2) Check your internet connection, 3) Try a different charger. If problems persist, please contact support@evcharging.com"
+    topic = _get_fallback_topic(user_message)
     
-    elif any(word in message_lower for word in ["help", "support", "assistance"]):
-        return "I'm here to help! I can assist with: charging recommendations, station information, pricing questions, troubleshooting, and booking help. What would you like to know?"
+    for faq_topic, _, response in FAQ_TOPICS:
+        if faq_topic == topic:
+            return response
     
-    else:
-        return "That's a great question! For specific information about our Smart EV Charging platform, please visit the 'My Stations' section or use 'AI Recommendations' to find the perfect charging station for your needs."
+    return "That's a great question! For specific information about our Smart EV Charging platform, please visit the 'My Stations' section or use 'AI Recommendations' to find the perfect charging station for your needs."
@@ -0,0 +1,122 @@
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+
+MAX_CONVERSATIONS = 1000
+MAX_TURNS = 10
+MAX_DIGEST_CHARS = 600
+IDLE_TIMEOUT_SECONDS = 60 * 60
+TURN_SNIPPET_CHARS = 90
+# Pseudo-role of the digest entry in get_history; ai/chatbot puts it in the
+# system context instead of replaying it as a turn
+DIGEST_ROLE = "digest"
+
+
+def _first_sentence(text, max_chars=TURN_SNIPPET_CHARS):
+    sentence = re.split(r"(?<=[.!?])\s", " ".join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3].rstrip() + "..."
+
+
+class Conversation:
+    """
+    Recent turns in a fixed-size ring buffer plus a digest of everything older
+    The digest is a truncation, not a summary: the first sentence of each
+    evicted turn, and only the most recent max_digest_chars of those
+    """
+
+    __slots__ = ("turns", "digest", "last_active")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.digest = ""
+        self.last_active = time.time()
+
+    def append(self, role, text, max_digest_chars):
+        if len(self.turns) == self.turns.maxlen:
+            self._compact(self.turns.popleft(), max_digest_chars)
+        self.turns.append((role, text))
+        self.last_active = time.time()
+
+    def _compact(self, turn, max_digest_chars):
+        """Append the evicted turn's first sentence to the digest, dropping the oldest lines past max_digest_chars"""
+        role, text = turn
+        line = f"{'User' if role == 'user' else 'Assistant'}: {_first_sentence(text)}"
+        digest = f"{self.digest}\n{line}" if self.digest else line
+        while len(digest) > max_digest_chars and "\n" in digest:
+            digest = digest.split("\n", 1)[1]
+        self.digest = digest[-max_digest_chars:]
+
+
+class ConversationStore:
+    """
+    Per-user chatbot memory with bounded size
+    - each conversation keeps at most max_turns turns verbatim; older turns are
+      cut to their first sentence in a digest capped at max_digest_chars, so
+      prompt size is bounded
+    - at most max_conversations are kept; the least recently used is evicted first,
+      and conversations idle for longer than idle_timeout are dropped
+    """
+
+    def __init__(self, max_conversations=MAX_CONVERSATIONS, max_turns=MAX_TURNS,
+                 max_digest_chars=MAX_DIGEST_CHARS, idle_timeout=IDLE_TIMEOUT_SECONDS):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_digest_chars = max_digest_chars
+        self.idle_timeout = idle_timeout
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire_idle(self):
+        # OrderedDict is kept in LRU order, so idle conversations sit at the front
+        cutoff = time.time() - self.idle_timeout
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if conversation.last_active >= cutoff:
+                break
+            del self._conversations[key]
+
+    def add_turn(self, key, role, text):
+        with self._lock:
+            self._expire_idle()
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = Conversation(self.max_turns)
+                self._conversations[key] = conversation
+            conversation.append(role, text, self.max_digest_chars)
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+    def get_turns(self, key):
+        """Verbatim recent turns [(role, text), ...], oldest first"""
+        with self._lock:
+            self._expire_idle()
+            conversation = self._conversations.get(key)
+            return list(conversation.turns) if conversation else []
+
+    def get_history(self, key):
+        """
+        Prompt-ready history for chat_with_bot: the digest (if any) as a leading
+        DIGEST_ROLE entry followed by the recent turns
+        """
+        with self._lock:
+            self._expire_idle()
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                return []
+            self._conversations.move_to_end(key)
+            history = list(conversation.turns)
+            if conversation.digest:
+                history.insert(0, (DIGEST_ROLE, conversation.digest))
+            return history
+
+    def clear(self, key):
+        with self._lock:
+            self._conversations.pop(key, None)
+
+    def __len__(self):
+        return len(self._conversations)
+
+
+conversation_store = ConversationStore()
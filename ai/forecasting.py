@@ -0,0 +1,169 @@
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from models.charging import HOUR_FORMAT
+
+logger = logging.getLogger(__name__)
+
+SEASON_HOURS = 168          # hour-of-week seasonality
+HISTORY_WEEKS = 8
+# Nine days, so a nightly run still covers the seven full UTC days the
+# analytics view shows from tomorrow's midnight until the next run
+HORIZON_HOURS = 9 * 24
+HISTORY_QUERY_STATIONS = 500
+Z_95 = 1.96
+
+# Holt-Winters grid, fitted for every station at once; the trend is damped so
+# sparse stations do not extrapolate a few busy hours into a ramp
+ALPHAS = (0.05, 0.15, 0.4)
+GAMMAS = (0.05, 0.15, 0.4)
+BETA = 0.01
+PHI = 0.98
+
+
+def load_hourly_history(cur, names, end, weeks=HISTORY_WEEKS):
+    """
+    Hourly session counts for the given stations, from session_rollup_hourly
+    Returns: (array of shape (len(names), weeks * 168) covering the hours before `end`,
+    rollup rows read)
+    """
+    hours = weeks * SEASON_HOURS
+    start = end - timedelta(hours=hours)
+    row_of = {name: i for i, name in enumerate(names)}
+    history = np.zeros((len(names), hours))
+    rows_read = 0
+
+    # Station batches keep each query on the (station_name, hour_bucket) key
+    for i in range(0, len(names), HISTORY_QUERY_STATIONS):
+        batch = names[i:i + HISTORY_QUERY_STATIONS]
+        cur.execute(f"""
+            SELECT station_name,
+                   CAST(ROUND((julianday(hour_bucket) - julianday(?)) * 24) AS INTEGER),
+                   sessions
+            FROM session_rollup_hourly
+            WHERE station_name IN ({", ".join("?" for _ in batch)}) AND hour_bucket >= ? AND hour_bucket < ?
+        """, (start.strftime(HOUR_FORMAT), *batch, start.strftime(HOUR_FORMAT), end.strftime(HOUR_FORMAT)))
+
+        rows, cols, counts = [], [], []
+        fetched = cur.fetchall()
+        rows_read += len(fetched)
+        for station_name, offset, sessions in fetched:
+            if 0 <= offset < hours:
+                rows.append(row_of[station_name])
+                cols.append(offset)
+                counts.append(sessions)
+        np.add.at(history, (np.array(rows, dtype=int), np.array(cols, dtype=int)), np.array(counts, dtype=float))
+    return history, rows_read
+
+
+def seasonal_naive(history, horizon=HORIZON_HOURS):
+    """
+    Same hour last week, for every station
+    Returns: (forecast, interval half-width / 1.96, in-sample MSE)
+    """
+    last_week = history[:, -SEASON_HOURS:]
+    steps = np.arange(horizon)
+    forecast = last_week[:, steps % SEASON_HOURS]
+
+    residuals = history[:, SEASON_HOURS:] - history[:, :-SEASON_HOURS]
+    mse = np.mean(residuals ** 2, axis=1)
+
+    # The error compounds once per week of horizon
+    weeks_ahead = steps // SEASON_HOURS + 1
+    spread = np.sqrt(mse)[:, None] * np.sqrt(weeks_ahead)[None, :]
+    return forecast, spread, mse
+
+
+def holt_winters(history, horizon=HORIZON_HOURS):
+    """
+    Additive damped Holt-Winters with hour-of-week seasonality
+    Every (alpha, gamma) in the grid is run for every station in one array
+    pass over time; each station keeps the pair with the lowest one-step MSE.
+    Returns: (forecast, interval half-width / 1.96, in-sample MSE)
+    """
+    stations, hours = history.shape
+    grid = np.array([(a, g) for a in ALPHAS for g in GAMMAS])
+    alpha = grid[:, 0][:, None]
+    gamma = grid[:, 1][:, None]
+    combos = len(grid)
+
+    # Initialise from the first week
+    first_week = history[:, :SEASON_HOURS]
+    level = np.tile(first_week.mean(axis=1), (combos, 1))
+    trend = np.zeros((combos, stations))
+    season = np.tile(first_week - first_week.mean(axis=1, keepdims=True), (combos, 1, 1))
+    sse = np.zeros((combos, stations))
+
+    for t in range(SEASON_HOURS, hours):
+        observed = history[:, t]
+        slot = t % SEASON_HOURS
+        seasonal = season[:, :, slot]
+
+        error = observed - (level + PHI * trend + seasonal)
+        sse += error ** 2
+
+        new_level = alpha * (observed - seasonal) + (1 - alpha) * (level + PHI * trend)
+        trend = BETA * (new_level - level) + (1 - BETA) * PHI * trend
+        season[:, :, slot] = gamma * (observed - new_level) + (1 - gamma) * seasonal
+        level = new_level
+
+    mse = sse / max(1, hours - SEASON_HOURS)
+    best = np.argmin(mse, axis=0)
+    pick = np.arange(stations)
+
+    steps = np.arange(1, horizon + 1)
+    damped = np.cumsum(PHI ** steps)
+    slots = (hours + steps - 1) % SEASON_HOURS
+    forecast = (
+        level[best, pick][:, None]
+        + damped[None, :] * trend[best, pick][:, None]
+        + season[best[:, None], pick[:, None], slots[None, :]]
+    )
+
+    best_alpha = grid[best, 0]
+    sigma = np.sqrt(mse[best, pick])
+    spread = sigma[:, None] * np.sqrt(1 + (steps[None, :] - 1) * best_alpha[:, None] ** 2)
+    return forecast, spread, mse[best, pick]
+
+
+def forecast_all_stations(history, horizon=HORIZON_HOURS):
+    """
+    Fit both models for every station and keep the better one per station
+    Returns: (expected, lower, upper, model names)
+    """
+    naive, naive_spread, naive_mse = seasonal_naive(history, horizon)
+    hw, hw_spread, hw_mse = holt_winters(history, horizon)
+
+    use_hw = hw_mse < naive_mse
+    expected = np.where(use_hw[:, None], hw, naive)
+    spread = np.where(use_hw[:, None], hw_spread, naive_spread)
+
+    expected = np.clip(expected, 0, None)
+    lower = np.clip(expected - Z_95 * spread, 0, None)
+    upper = expected + Z_95 * spread
+    models = np.where(use_hw, "holt_winters", "seasonal_naive")
+    return expected, lower, upper, models
+
+
+def forecast_rows(names, history, end, horizon=HORIZON_HOURS):
+    """station_forecasts rows for every station in `names` (one history row each)"""
+    expected, lower, upper, models = forecast_all_stations(history, horizon)
+    buckets = [(end + timedelta(hours=h)).strftime(HOUR_FORMAT) for h in range(horizon)]
+    generated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    return [
+        (name, buckets[h], round(float(expected[i, h]), 3), round(float(lower[i, h]), 3),
+         round(float(upper[i, h]), 3), str(models[i]), generated_at)
+        for i, name in enumerate(names)
+        for h in range(horizon)
+    ]
+
+
+def write_forecasts(cur, rows):
+    """Replace station_forecasts on the caller's transaction"""
+    cur.execute("DELETE FROM station_forecasts")
+    cur.executemany("""
+        INSERT INTO station_forecasts
+        (station_name, hour_bucket, expected, lower, upper, model, generated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
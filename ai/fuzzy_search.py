@@ -0,0 +1,316 @@
+import re
+import heapq
+import logging
+import threading
+from itertools import product
+from collections import defaultdict
+from models.db import get_db
+
+logger = logging.getLogger(__name__)
+
+MIN_TOKEN_LENGTH = 3
+DEFAULT_MIN_SIMILARITY = 0.35
+MAX_QUERY_TOKENS = 4
+MAX_GROUPS_PER_TOKEN = 6
+MENTION_MIN_SIMILARITY = 0.45
+MAX_MENTION_POSTING = 5000
+# A query word counts as a place/name term only when it is this close to a station word
+TERM_MIN_SIMILARITY = 0.5
+
+
+def _tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(t) >= MIN_TOKEN_LENGTH]
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index for typo-tolerant station lookup
+
+    Trigrams index the distinct words of station names/locations rather than the
+    stations themselves: a misspelled query word is matched against the (small)
+    vocabulary first, then expanded to stations through a word -> stations map.
+
+    Scoring stays in C-level set operations: per query word, stations are grouped
+    by their best similarity, and group combinations are visited in descending
+    total score until enough stations are found. That keeps lookups at a few
+    milliseconds even when 10^5 stations share words like "Bangalore".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stations = {}                         # station_id -> (name, location, tokens)
+        self._token_stations = defaultdict(set)     # token -> station ids
+        self._name_token_stations = defaultdict(set)  # token -> ids of stations with it in their name
+        self._trigram_tokens = defaultdict(set)     # trigram -> tokens
+        self._token_trigrams = {}                   # token -> trigrams
+        self._approved = set()
+        self.loaded = False
+
+    def load(self, rows):
+        """Bulk (re)build from (id, name, location, approved) rows"""
+        with self._lock:
+            self._stations.clear()
+            self._token_stations.clear()
+            self._name_token_stations.clear()
+            self._trigram_tokens.clear()
+            self._token_trigrams.clear()
+            self._approved.clear()
+            for station_id, name, location, approved in rows:
+                self._add(station_id, name, location, approved)
+            self.loaded = True
+
+    def add(self, station_id, name, location, approved):
+        """Insert or replace a single station"""
+        with self._lock:
+            self._remove(station_id)
+            self._add(station_id, name, location, approved)
+
+    def remove(self, station_id):
+        with self._lock:
+            self._remove(station_id)
+
+    def _add(self, station_id, name, location, approved):
+        tokens = frozenset(_tokenize(name) + _tokenize(location))
+        self._stations[station_id] = (name, location, tokens)
+        if approved:
+            self._approved.add(station_id)
+        for token in _tokenize(name):
+            self._name_token_stations[token].add(station_id)
+        for token in tokens:
+            self._token_stations[token].add(station_id)
+            if token not in self._token_trigrams:
+                grams = _trigrams(token)
+                self._token_trigrams[token] = grams
+                for gram in grams:
+                    self._trigram_tokens[gram].add(token)
+
+    def _remove(self, station_id):
+        entry = self._stations.pop(station_id, None)
+        if not entry:
+            return
+        self._approved.discard(station_id)
+        for token in _tokenize(entry[0]):
+            ids = self._name_token_stations.get(token)
+            if ids is not None:
+                ids.discard(station_id)
+                if not ids:
+                    del self._name_token_stations[token]
+        for token in entry[2]:
+            ids = self._token_stations.get(token)
+            if ids is None:
+                continue
+            ids.discard(station_id)
+            if not ids:
+                # Last station using this word - drop it from the vocabulary
+                del self._token_stations[token]
+                for gram in self._token_trigrams.pop(token, ()):
+                    self._trigram_tokens[gram].discard(token)
+                    if not self._trigram_tokens[gram]:
+                        del self._trigram_tokens[gram]
+
+    def _similar_tokens(self, token, min_similarity):
+        """Vocabulary words whose trigram Jaccard similarity with token is >= min_similarity"""
+        grams = _trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._trigram_tokens.get(gram, ()):
+                shared[candidate] += 1
+
+        matches = {}
+        for candidate, overlap in shared.items():
+            similarity = overlap / (len(grams) + len(self._token_trigrams[candidate]) - overlap)
+            if similarity >= min_similarity:
+                matches[candidate] = similarity
+        return matches
+
+    def _similarity_groups(self, token, min_similarity):
+        """
+        Disjoint (similarity, station ids) groups for one query word, best first
+        Each station lands in the group of its best-matching word
+        """
+        by_similarity = defaultdict(set)
+        for candidate, similarity in self._similar_tokens(token, min_similarity).items():
+            by_similarity[round(similarity, 3)] |= self._token_stations[candidate]
+
+        groups = []
+        seen = set()
+        for similarity in sorted(by_similarity, reverse=True)[:MAX_GROUPS_PER_TOKEN]:
+            ids = by_similarity[similarity] - seen
+            if ids:
+                groups.append((similarity, ids))
+                seen |= ids
+        return groups, seen
+
+    def search(self, text, limit=10, min_similarity=DEFAULT_MIN_SIMILARITY, approved_only=True):
+        """
+        Rank stations by fuzzy similarity to text
+        A station's score is the mean, over query words, of its best matching word's similarity
+
+        Returns: list of (station_id, name, location, score) best first
+        """
+        query_tokens = list(dict.fromkeys(_tokenize(text)))[:MAX_QUERY_TOKENS]
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            per_token = [self._similarity_groups(token, min_similarity) for token in query_tokens]
+
+            # Each word either matches through one of its groups or not at all (None)
+            options = [[(sim, ids) for sim, ids in groups] + [(0.0, None)] for groups, _ in per_token]
+            combos = sorted(product(*options), key=lambda combo: sum(sim for sim, _ in combo), reverse=True)
+
+            results = []
+            for combo in combos:
+                present = sorted((ids for _, ids in combo if ids is not None), key=len)
+                if not present:
+                    break
+
+                candidates = present[0].intersection(*present[1:])
+                for (_, ids), (_, matched) in zip(combo, per_token):
+                    if ids is None and candidates:
+                        candidates = candidates - matched
+                if approved_only:
+                    candidates = candidates & self._approved
+                if not candidates:
+                    continue
+
+                score = round(sum(sim for sim, _ in combo) / len(query_tokens), 3)
+                for station_id in heapq.nsmallest(limit - len(results), candidates):
+                    name, location, _ = self._stations[station_id]
+                    results.append((station_id, name, location, score))
+                if len(results) >= limit:
+                    break
+
+            return results
+
+    def mentioned_stations(self, text, limit=3, min_similarity=MENTION_MIN_SIMILARITY):
+        """
+        Stations whose whole name appears (allowing typos) somewhere in free text
+        Unlike search(), extra words in the text do not dilute the score, so this
+        suits chat messages like "how long is the queue at centrl hub?"
+
+        Returns: list of (station_id, name, location, score) - longer, closer names first
+        """
+        matched = {}
+        with self._lock:
+            for token in set(_tokenize(text)):
+                for candidate, similarity in self._similar_tokens(token, min_similarity).items():
+                    matched[candidate] = max(similarity, matched.get(candidate, 0))
+
+            # A fully mentioned station shows up in the posting of each of its name words,
+            # so rare words find it without walking the postings of words like "station"
+            postings = sorted(
+                (self._name_token_stations[token] for token in matched if token in self._name_token_stations),
+                key=len
+            )
+
+            found = {}
+            for station_ids in postings:
+                if len(station_ids) > MAX_MENTION_POSTING:
+                    break
+                for station_id in station_ids:
+                    if station_id in found or station_id not in self._approved:
+                        continue
+                    name, location, _ = self._stations[station_id]
+                    name_tokens = _tokenize(name)
+                    if name_tokens and all(token in matched for token in name_tokens):
+                        score = sum(matched[token] for token in name_tokens) / len(name_tokens)
+                        found[station_id] = (len(name_tokens), round(score, 3), name, location)
+
+            ranked = sorted(found.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)[:limit]
+            return [(station_id, name, location, score) for station_id, (_, score, name, location) in ranked]
+
+    def known_terms(self, text, min_similarity=TERM_MIN_SIMILARITY):
+        """
+        Words of text that name something in the vocabulary
+        A word is kept when it is close to a station word (typos allowed) or is
+        the start of one ("koram" for "koramangala"); anything else cannot match
+
+        Returns: list of words, in order of first appearance
+        """
+        terms = []
+        with self._lock:
+            for token in dict.fromkeys(_tokenize(text)):
+                if token in self._token_stations or any(
+                    similarity >= min_similarity or candidate.startswith(token)
+                    for candidate, similarity in self._similar_tokens(token, 0).items()
+                ):
+                    terms.append(token)
+        return terms
+
+    def __len__(self):
+        return len(self._stations)
+
+
+station_index = TrigramIndex()
+
+
+def _ensure_loaded():
+    if station_index.loaded:
+        return
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT id, name, location, approved FROM stations")
+        station_index.load(cur.fetchall())
+        logger.info(f"Trigram index built for {len(station_index)} stations")
+    except Exception as e:
+        logger.error(f"Error building trigram index: {e}")
+    finally:
+        conn.close()
+
+
+def fuzzy_search_stations(text, limit=10, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """
+    Typo-tolerant lookup of approved stations by name/location words
+    Returns: list of (station_id, name, location, score) with score in 0..1
+    """
+    _ensure_loaded()
+    return station_index.search(text, limit=limit, min_similarity=min_similarity)
+
+
+def find_mentioned_stations(text, limit=3):
+    """
+    Approved stations named (typos allowed) anywhere in a chat message
+    Returns: list of (station_id, name, location, score)
+    """
+    _ensure_loaded()
+    return station_index.mentioned_stations(text, limit=limit)
+
+
+def known_station_terms(text):
+    """
+    Words of text that match a word of some station name or location
+    Returns: list of words, empty when none do
+    """
+    _ensure_loaded()
+    return station_index.known_terms(text)
+
+
+def refresh_station(station_id):
+    """Re-index one station after it is added, edited or approved"""
+    if not station_index.loaded:
+        # The first search will load everything, including this station
+        return
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT id, name, location, approved FROM stations WHERE id = ?", (station_id,))
+        row = cur.fetchone()
+        if row:
+            station_index.add(*row)
+        else:
+            station_index.remove(station_id)
+    except Exception as e:
+        logger.error(f"Error refreshing station {station_id} in trigram index: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,26 @@
+import os
+import threading
+import google.genai as genai
+
+GEMINI_MODEL = "models/gemini-2.0-flash"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Shared Gemini client for the process
+    Set GEMINI_BASE_URL to point every AI feature at another endpoint,
+    e.g. scripts/fake_gemini_server.py for offline load tests
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                base_url = os.getenv("GEMINI_BASE_URL", "")
+                if base_url:
+                    _client = genai.Client(http_options={"base_url": base_url})
+                else:
+                    _client = genai.Client()
+    return _client
@@ -1,214 +1,172 @@
 from models.db import get_db
-from datetime import datetime, timedelta
+from models.charging import combine_windows, get_user_station_stats, get_user_stats, windowed_totals
+from ai.sketches import user_percentiles
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def get_user_charging_statistics(user_id):
-    """Get comprehensive charging statistics for a user"""
-    conn = get_db()
-    cur = conn.cursor()
-    
+class InsightsContext:
+    """
+    One user's aggregates, loaded once per request
+    Lifetime totals are single-row lookups in user_stats/user_station_stats;
+    only the trailing spending windows read sessions, through an index.
+    """
+
+    def __init__(self, user_id, totals, stations, windows, percentiles):
+        self.user_id = user_id
+        self.totals = totals                # user_stats row, see models.charging.get_user_stats
+        self.stations = stations            # station name -> completed totals
+        self.windows = windows              # window -> {total, sessions}
+        self.percentiles = percentiles      # metric -> {below, above} among all users, or None
+
+    @classmethod
+    def load(cls, user_id):
+        conn = get_db()
+        cur = conn.cursor()
+
+        try:
+            totals = get_user_stats(cur, user_id)
+            stations = get_user_station_stats(cur, user_id)
+            windows = combine_windows(windowed_totals(cur, "user_id", user_id))
+            percentiles = user_percentiles(cur, totals)
+            return cls(user_id, totals, stations, windows, percentiles)
+        finally:
+            conn.close()
+
+
+def _load_context(user_id):
     try:
-        # Total sessions and kWh
-        cur.execute("""
-            SELECT COUNT(*) as total_sessions, SUM(units) as total_units, 
-                   SUM(amount) as total_spent
-            FROM charging_sessions 
-            WHERE user_id = ? AND status = 'Completed'
-        """, (user_id,))
-        
-        stats = cur.fetchone()
-        total_sessions = stats[0] if stats and stats[0] else 0
-        total_units = stats[1] if stats and stats[1] else 0
-        total_spent = stats[2] if stats and stats[2] else 0
-        
-        # Average per session
-        avg_per_session = (total_spent / total_sessions) if total_sessions > 0 else 0
-        avg_units_per_session = (total_units / total_sessions) if total_sessions > 0 else 0
-        
-        # Most used station
-        cur.execute("""
-            SELECT station_name, COUNT(*) as count
-            FROM charging_sessions 
-            WHERE user_id = ? AND status = 'Completed'
-            GROUP BY station_name
-            ORDER BY count DESC
-            LIMIT 1
-        """, (user_id,))
-        
-        fav_station = cur.fetchone()
-        
-        # Last charging session
-        cur.execute("""
-            SELECT started_at, units, amount, station_name, status
-            FROM charging_sessions 
-            WHERE user_id = ?
-            ORDER BY started_at DESC
-            LIMIT 1
-        """, (user_id,))
-        
-        last_session = cur.fetchone()
-        
-        return {
-            "total_sessions": total_sessions,
-            "total_units_charged": round(total_units, 2),
-            "total_spent": round(total_spent, 2),
-            "avg_per_session": round(avg_per_session, 2),
-            "avg_units_per_session": round(avg_units_per_session, 2),
-            "favorite_station": fav_station[0] if fav_station else "N/A",
-            "favorite_count": fav_station[1] if fav_station else 0,
-            "last_session": {
-                "date": last_session[0] if last_session and last_session[0] else "N/A",
-                "units": last_session[1] if last_session and last_session[1] else 0,
-                "amount": last_session[2] if last_session and last_session[2] else 0,
-                "station": last_session[3] if last_session and last_session[3] else "N/A",
-                "status": last_session[4] if last_session and last_session[4] else "N/A"
-            } if last_session else None
-        }
-        
+        return InsightsContext.load(user_id)
     except Exception as e:
-        logger.error(f"Error getting user stats: {e}")
+        logger.error(f"Error loading insights for user {user_id}: {e}")
+        return None
+
+
+def _share(context, metric, side):
+    """Percent of users below/above this user on a metric, None without a sketch"""
+    percentile = context.percentiles.get(metric)
+    return percentile[side] if percentile else None
+
+
+def get_user_charging_statistics(user_id, context=None):
+    """Get comprehensive charging statistics for a user"""
+    context = context or _load_context(user_id)
+    if context is None:
         return None
-    finally:
-        conn.close()
 
+    totals = context.totals
+    total_sessions = totals["completed"]
+    total_units = totals["units"]
+    total_spent = totals["spend"]
+
+    # Average per session
+    avg_per_session = (total_spent / total_sessions) if total_sessions > 0 else 0
+    avg_units_per_session = (total_units / total_sessions) if total_sessions > 0 else 0
+
+    # Most used station
+    fav_station = max(((name, s["completed"]) for name, s in context.stations.items()), key=lambda f: f[1], default=None)
+
+    # Last charging session
+    last_session = totals["last_session"]
+
+    return {
+        "total_sessions": total_sessions,
+        "total_units_charged": round(total_units, 2),
+        "total_spent": round(total_spent, 2),
+        "avg_per_session": round(avg_per_session, 2),
+        "avg_units_per_session": round(avg_units_per_session, 2),
+        "favorite_station": fav_station[0] if fav_station else "N/A",
+        "favorite_count": fav_station[1] if fav_station else 0,
+        "more_active_than_pct": _share(context, "user_sessions", "below"),
+        "last_session": {
+            "date": last_session[0] if last_session and last_session[0] else "N/A",
+            "units": last_session[1] if last_session and last_session[1] else 0,
+            "amount": last_session[2] if last_session and last_session[2] else 0,
+            "station": last_session[3] if last_session and last_session[3] else "N/A",
+            "status": last_session[4] if last_session and last_session[4] else "N/A"
+        } if last_session else None
+    }
 
-def get_user_eco_impact(user_id):
+
+def get_user_eco_impact(user_id, context=None):
     """Calculate environmental impact of user's charging habits"""
-    conn = get_db()
-    cur = conn.cursor()
-    
-    try:
-        # Get total units and average green score
-        cur.execute("""
-            SELECT SUM(cs.units), AVG(s.green_score)
-            FROM charging_sessions cs
-            JOIN stations s ON cs.station_name = s.name
-            WHERE cs.user_id = ? AND cs.status = 'Completed'
-        """, (user_id,))
-        
-        result = cur.fetchone()
-        total_units = result[0] if result and result[0] else 0
-        avg_green_score = result[1] if result and result[1] else 0
-        
-        # Carbon footprint calculation
-        # Average EV charging: 0.4-0.6 kg CO2 per kWh (depends on grid source)
-        # High green score: 0.2 kg CO2 per kWh
-        # Low green score: 0.6 kg CO2 per kWh
-        
-        co2_factor = 0.2 + (10 - avg_green_score) * 0.04 if avg_green_score else 0.4
-        carbon_saved = total_units * co2_factor
-        
-        # Trees equivalent (1 tree absorbs ~20kg CO2/year)
-        trees_equivalent = carbon_saved / 20
-        
-        # Green charging percentage
-        green_percentage = avg_green_score * 10 if avg_green_score else 0
-        
-        return {
-            "total_green_charges": total_units,
-            "avg_green_score": round(avg_green_score, 1),
-            "estimated_co2_emissions_kg": round(carbon_saved, 2),
-            "trees_equivalent": round(trees_equivalent, 1),
-            "eco_percentage": round(green_percentage, 1),
-            "eco_rating": "Excellent Eco-Warrior!" if avg_green_score >= 8 else "Good Green Citizen" if avg_green_score >= 6 else "Moderate" if avg_green_score >= 4 else "Standard",
-            "recommendation": "Amazing! Keep using green stations!" if avg_green_score >= 8 else "Try to choose higher-rated green stations when possible"
-        }
-        
-    except Exception as e:
-        logger.error(f"Error calculating eco impact: {e}")
+    context = context or _load_context(user_id)
+    if context is None:
         return None
-    finally:
-        conn.close()
 
+    # Every completed session's CO2 was recorded at its station's green score
+    # back then; the average score is weighted by energy
+    totals = context.totals
+    total_units = totals["units"]
+    avg_green_score = (totals["green_units"] / totals["rated_units"]) if totals["rated_units"] else 0
+    carbon_saved = totals["co2_kg"]
+
+    # Trees equivalent (1 tree absorbs ~20kg CO2/year)
+    trees_equivalent = carbon_saved / 20
 
-def get_user_spending_insights(user_id):
+    # Green charging percentage
+    green_percentage = avg_green_score * 10 if avg_green_score else 0
+
+    return {
+        "total_green_charges": round(total_units, 2),
+        "avg_green_score": round(avg_green_score, 1),
+        "estimated_co2_emissions_kg": round(carbon_saved, 2),
+        "trees_equivalent": round(trees_equivalent, 1),
+        "eco_percentage": round(green_percentage, 1),
+        "greener_than_pct": _share(context, "user_green_score", "below"),
+        "eco_rating": "Excellent Eco-Warrior!" if avg_green_score >= 8 else "Good Green Citizen" if avg_green_score >= 6 else "Moderate" if avg_green_score >= 4 else "Standard",
+        "recommendation": "Amazing! Keep using green stations!" if avg_green_score >= 8 else "Try to choose higher-rated green stations when possible"
+    }
+
+
+def get_user_spending_insights(user_id, context=None):
     """Analyze user spending patterns and savings opportunities"""
-    conn = get_db()
-    cur = conn.cursor()
-    
-    try:
-        # Spending by station
-        cur.execute("""
-            SELECT station_name, SUM(amount) as total, COUNT(*) as count, 
-                   AVG(amount) as avg_session
-            FROM charging_sessions 
-            WHERE user_id = ? AND status = 'Completed'
-            GROUP BY station_name
-            ORDER BY total DESC
-            LIMIT 5
-        """, (user_id,))
-        
-        spending_by_station = cur.fetchall()
-        
-        # Spending trends (last 7, 14, 30 days)
-        def get_spending_period(days):
-            date_threshold = (datetime.now() - timedelta(days=days)).isoformat()
-            cur.execute("""
-                SELECT SUM(amount), COUNT(*)
-                FROM charging_sessions 
-                WHERE user_id = ? AND status = 'Completed' AND started_at > ?
-            """, (user_id, date_threshold))
-            result = cur.fetchone()
-            return (result[0] if result and result[0] else 0, result[1] if result and result[1] else 0)
-        
-        spending_7d = get_spending_period(7)
-        spending_14d = get_spending_period(14)
-        spending_30d = get_spending_period(30)
-        
-        # Find cheapest station used
-        cur.execute("""
-            SELECT station_name, AVG(amount/units) as avg_price_per_unit
-            FROM charging_sessions 
-            WHERE user_id = ? AND status = 'Completed' AND units > 0
-            GROUP BY station_name
-            ORDER BY avg_price_per_unit ASC
-            LIMIT 1
-        """, (user_id,))
-        
-        cheapest = cur.fetchone()
-        
-        return {
-            "spending_last_7_days": {
-                "total": round(spending_7d[0], 2),
-                "sessions": spending_7d[1]
-            },
-            "spending_last_14_days": {
-                "total": round(spending_14d[0], 2),
-                "sessions": spending_14d[1]
-            },
-            "spending_last_30_days": {
-                "total": round(spending_30d[0], 2),
-                "sessions": spending_30d[1]
-            },
-            "top_stations": [
-                {
-                    "name": s[0],
-                    "total": round(s[1], 2),
-                    "sessions": s[2],
-                    "avg_per_session": round(s[3], 2)
-                }
-                for s in spending_by_station
-            ],
-            "cheapest_station": cheapest[0] if cheapest else "N/A",
-            "recommendation": f"Save money by charging at {cheapest[0]} more often!" if cheapest else "No spending data available yet"
-        }
-        
-    except Exception as e:
-        logger.error(f"Error analyzing spending: {e}")
+    context = context or _load_context(user_id)
+    if context is None:
         return None
-    finally:
-        conn.close()
 
+    completed = context.stations
 
-def get_personalized_recommendations(user_id):
+    # Spending by station
+    spending_by_station = sorted(completed.items(), key=lambda item: item[1]["amount"], reverse=True)[:5]
+
+    # Spending trends over every window
+    spending = context.windows
+
+    # Find cheapest station used
+    priced = [(name, s["avg_unit_price"]) for name, s in completed.items() if s["avg_unit_price"] is not None]
+    cheapest = min(priced, key=lambda p: p[1], default=None)
+
+    return {
+        "spending_last_7_days": spending["7d"],
+        "spending_last_14_days": spending["14d"],
+        "spending_last_30_days": spending["30d"],
+        "spending_last_90_days": spending["90d"],
+        "spending_month_to_date": spending["mtd"],
+        "top_stations": [
+            {
+                "name": name,
+                "total": round(s["amount"], 2),
+                "sessions": s["completed"],
+                "avg_per_session": round(s["amount"] / s["completed"], 2)
+            }
+            for name, s in spending_by_station
+        ],
+        "cheapest_station": cheapest[0] if cheapest else "N/A",
+        # Share of users who pay more per session
+        "cheaper_than_pct": _share(context, "user_cost_per_session", "above"),
+        "recommendation": f"Save money by charging at {cheapest[0]} more often!" if cheapest else "No spending data available yet"
+    }
+
+
+def get_personalized_recommendations(user_id, context=None):
     """Generate personalized recommendations for user"""
     try:
-        stats = get_user_charging_statistics(user_id)
-        eco = get_user_eco_impact(user_id)
-        spending = get_user_spending_insights(user_id)
+        context = context or _load_context(user_id)
+        stats = get_user_charging_statistics(user_id, context)
+        eco = get_user_eco_impact(user_id, context)
+        spending = get_user_spending_insights(user_id, context)
         
         recommendations = []
         
@@ -220,7 +178,7 @@ def get_personalized_recommendations(user_id):
                 "message": "You've just started! Build a habit by charging regularly at your favorite station.",
                 "icon": "🚀"
             })
-        elif stats and stats["total_sessions"] > 100:
+        elif stats and (stats["total_sessions"] > 100 or (stats["more_active_than_pct"] or 0) >= 90):
             recommendations.append({
                 "type": "loyalty",
                 "title": "Loyal User",
@@ -228,8 +186,24 @@ def get_personalized_recommendations(user_id):
                 "icon": "⭐"
             })
         
-        # Recommendation 2: Eco impact
-        if eco and eco["avg_green_score"] < 5:
+        # Recommendation 2: Eco impact, ranked against other users when the sketches exist
+        greener_than = eco["greener_than_pct"] if eco else None
+        if greener_than is not None:
+            if greener_than < 25:
+                recommendations.append({
+                    "type": "eco",
+                    "title": "Go Green",
+                    "message": f"You charge greener than only {greener_than}% of users. Higher green-score stations would cut your carbon footprint!",
+                    "icon": "🌱"
+                })
+            elif greener_than >= 75:
+                recommendations.append({
+                    "type": "eco_hero",
+                    "title": "Eco-Warrior",
+                    "message": f"Amazing! You charge greener than {greener_than}% of users. Keep it up!",
+                    "icon": "🌍"
+                })
+        elif eco and eco["avg_green_score"] < 5:
             recommendations.append({
                 "type": "eco",
                 "title": "Go Green",
@@ -245,7 +219,22 @@ def get_personalized_recommendations(user_id):
             })
         
         # Recommendation 3: Spending optimization
-        if spending and spending["spending_last_30_days"]["sessions"] > 0:
+        cheaper_than = spending["cheaper_than_pct"] if spending else None
+        if cheaper_than is not None and cheaper_than < 25 and spending["cheapest_station"] != "N/A":
+            recommendations.append({
+                "type": "budget",
+                "title": "Save Money",
+                "message": f"You pay more per session than most users. Try {spending['cheapest_station']} - it's cheaper and equally reliable!",
+                "icon": "💰"
+            })
+        elif cheaper_than is not None and cheaper_than >= 75:
+            recommendations.append({
+                "type": "budget_wise",
+                "title": "Budget Conscious",
+                "message": f"Great spending habits! You pay less per session than {cheaper_than}% of users.",
+                "icon": "✅"
+            })
+        elif cheaper_than is None and spending and spending["spending_last_30_days"]["sessions"] > 0:
             avg_cost = spending["spending_last_30_days"]["total"] / spending["spending_last_30_days"]["sessions"]
             if avg_cost > 100:
                 recommendations.append({
@@ -280,9 +269,15 @@ def get_personalized_recommendations(user_id):
 
 def get_user_insights_dashboard(user_id):
     """Get complete insights dashboard for user"""
+    # Every section shares one InsightsContext: one connection and four small
+    # queries (user_stats, user_station_stats, windowed totals, sketches)
+    context = _load_context(user_id)
+    if context is None:
+        return {"statistics": None, "eco_impact": None, "spending": None, "recommendations": []}
+
     return {
-        "statistics": get_user_charging_statistics(user_id),
-        "eco_impact": get_user_eco_impact(user_id),
-        "spending": get_user_spending_insights(user_id),
-        "recommendations": get_personalized_recommendations(user_id)
+        "statistics": get_user_charging_statistics(user_id, context),
+        "eco_impact": get_user_eco_impact(user_id, context),
+        "spending": get_user_spending_insights(user_id, context),
+        "recommendations": get_personalized_recommendations(user_id, context)
     }
@@ -0,0 +1,238 @@
+import re
+import logging
+from models.db import get_db
+from ai.fuzzy_search import find_mentioned_stations
+
+logger = logging.getLogger(__name__)
+
+LAST = r"(last|latest|most recent|previous)"
+QUEUE = r"(queue|line|wait|waiting time)"
+
+# Ordered: the first intent whose pattern matches wins. Patterns are question
+# forms ("how much did I spend"), not lone keywords: "cost", "bill" or "charge"
+# turn up in plenty of questions these answers do not fit.
+INTENT_PATTERNS = [
+    ("my_last_session", "|".join([
+        rf"\b(what|when|where|how) (was|were|did|about) my {LAST} (charging )?(session|charge)\b",
+        rf"\bhow much did my {LAST} (charging )?(session|charge) cost\b",
+        rf"^(show|show me|tell me about|details of|details for) my {LAST} (charging )?(session|charge)\b",
+        rf"^my {LAST} (charging )?(session|charge)\W*$",
+    ])),
+    ("my_spending", "|".join([
+        r"\b(how much|what) (have|did|do) i (spend|spent|pay|paid)\b",
+        r"\bwhat('s| is| are) my (total )?(spending|spend|charging costs?|bill)\b",
+        r"^(show|show me|tell me) my (total )?(spending|spend|bill)\b",
+    ])),
+    ("my_sessions", "|".join([
+        r"\bhow many (times|sessions|charges) (have|did) i\b",
+        r"^(show|show me|what('s| is| are)) my (charging )?(sessions|history)\b",
+    ])),
+    ("station_queue", "|".join([
+        rf"\bhow (long|big|busy) is the {QUEUE}\b",
+        rf"\bhow many (people|cars|users) (are )?(in the {QUEUE}|waiting|queued)\b",
+        rf"\b(is|are) (there )?(a |any )?({QUEUE}|people waiting)\b",
+        r"\b(is|are) (any )?(chargers?|slots?) (free|available)\b",
+        r"\bhow busy is\b",
+        r"^is \w+( \w+){0,3} (busy|free|available)( right now| now)?\W*$",
+    ])),
+    ("station_price", "|".join([
+        r"\b(what('s| is| are)|how much is) the (price|cost|rate|tariff)s? (at|of|for)\b",
+        r"\bhow much (does|do|will) (it|charging) cost (at|in)\b",
+        r"\bhow much (does|do) \w+( \w+){0,3} charge\b",
+    ])),
+    ("cheapest_station", r"\b(cheapest|lowest price|least expensive|most affordable)\b"),
+    ("greenest_station", r"\b(greenest|most eco|most green|highest green|best green)\b"),
+]
+
+
+def classify_intent(user_message):
+    """
+    Keyword/regex intent classifier for questions our own data can answer
+    Returns: intent name or None for open-ended text
+    """
+    message = user_message.lower()
+    for intent, pattern in INTENT_PATTERNS:
+        if re.search(pattern, message):
+            return intent
+    return None
+
+
+def _match_station(user_message):
+    """Station named in the message (typos allowed), or None"""
+    matches = find_mentioned_stations(user_message, limit=1)
+    return matches[0] if matches else None
+
+
+def _station_status(cur, station_id):
+    cur.execute("""
+        SELECT s.name, s.chargers, s.price, s.green_score,
+               (SELECT COUNT(*) FROM charging_sessions cs
+                WHERE cs.station_name = s.name AND cs.status = 'Active'),
+               (SELECT COUNT(*) FROM waiting_queue w WHERE w.station_name = s.name)
+        FROM stations s
+        WHERE s.id = ?
+    """, (station_id,))
+    return cur.fetchone()
+
+
+def _queue_depth(cur, station_name, user_id=None):
+    """People waiting at a station, and the user's own position if they are one of them"""
+    cur.execute("SELECT COUNT(*) FROM waiting_queue WHERE station_name = ?", (station_name,))
+    depth = cur.fetchone()[0]
+    if not depth or user_id is None:
+        return depth, None
+
+    # Same ordering as the queue status page
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM waiting_queue
+        WHERE station_name = ?
+          AND joined_at <= (
+            SELECT joined_at FROM waiting_queue
+            WHERE station_name = ? AND user_id = ?
+            ORDER BY joined_at ASC
+            LIMIT 1
+          )
+    """, (station_name, station_name, user_id))
+    position = cur.fetchone()[0]
+    return depth, position or None
+
+
+def _answer_station_queue(cur, user_message, user_id):
+    match = _match_station(user_message)
+    if not match:
+        return None
+
+    name, chargers, price, green_score, active, _ = _station_status(cur, match[0])
+    queued, position = _queue_depth(cur, name, user_id)
+    waiting = f"{queued} {'person is' if queued == 1 else 'people are'} in the queue"
+
+    if position:
+        return f"{waiting} at {name} and you are at position {position}."
+    free = max(chargers - active, 0)
+    if free:
+        if queued:
+            return f"{name} has {free} of {chargers} chargers free, but {waiting} ahead of new arrivals."
+        return f"{name} has {free} of {chargers} chargers free right now and nobody is waiting. You can start charging straight away."
+    in_use = f"The only charger at {name} is" if chargers == 1 else f"All {chargers} chargers at {name} are"
+    if queued:
+        return f"{in_use} in use and {waiting}. Joining now would put you at position {queued + 1}."
+    return f"{in_use} in use, but the queue is empty - you would be next in line."
+
+
+def _answer_station_price(cur, user_message, user_id):
+    match = _match_station(user_message)
+    if not match:
+        return None
+
+    name, chargers, price, green_score, active, queued = _station_status(cur, match[0])
+    return f"{name} charges ₹{price}/kWh and has a green score of {green_score}/10."
+
+
+def _best_station(cur, order_by, green_only=False):
+    cur.execute(f"""
+        SELECT name, location, price, green_score
+        FROM stations
+        WHERE approved = 1 {"AND green_score >= 7" if green_only else ""}
+        ORDER BY {order_by}
+        LIMIT 1
+    """)
+    return cur.fetchone()
+
+
+def _answer_cheapest_station(cur, user_message, user_id):
+    green_only = bool(re.search(r"\b(green|eco|renewable|clean)\b", user_message.lower()))
+    row = _best_station(cur, "price ASC, green_score DESC", green_only)
+    if not row:
+        return None
+
+    name, location, price, green_score = row
+    qualifier = "green station (score 7+)" if green_only else "station"
+    return f"The cheapest {qualifier} is {name} in {location} at ₹{price}/kWh (green score {green_score}/10)."
+
+
+def _answer_greenest_station(cur, user_message, user_id):
+    row = _best_station(cur, "green_score DESC, price ASC")
+    if not row:
+        return None
+
+    name, location, price, green_score = row
+    return f"The greenest station is {name} in {location} with a green score of {green_score}/10, at ₹{price}/kWh."
+
+
+def _answer_my_last_session(cur, user_message, user_id):
+    cur.execute("""
+        SELECT station_name, units, amount, status, started_at
+        FROM charging_sessions
+        WHERE user_id = ?
+        ORDER BY started_at DESC
+        LIMIT 1
+    """, (user_id,))
+    row = cur.fetchone()
+    if not row:
+        return "You haven't charged with us yet. Use 'AI Recommendations' to find a station!"
+
+    station_name, units, amount, status, started_at = row
+    return f"Your last session was at {station_name} on {started_at}: {units or 0} kWh for ₹{round(amount or 0, 2)} ({status})."
+
+
+def _answer_my_spending(cur, user_message, user_id):
+    cur.execute("""
+        SELECT COUNT(*), COALESCE(SUM(amount), 0), COALESCE(SUM(units), 0)
+        FROM charging_sessions
+        WHERE user_id = ? AND status = 'Completed'
+    """, (user_id,))
+    sessions, spent, units = cur.fetchone()
+    if not sessions:
+        return "You don't have any completed charging sessions yet, so nothing has been spent."
+    return f"You've spent ₹{round(spent, 2)} on {round(units, 2)} kWh across {sessions} completed sessions (₹{round(spent / sessions, 2)} per session on average)."
+
+
+def _answer_my_sessions(cur, user_message, user_id):
+    cur.execute("""
+        SELECT COUNT(*), SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'Active' THEN 1 ELSE 0 END)
+        FROM charging_sessions
+        WHERE user_id = ?
+    """, (user_id,))
+    total, completed, active = cur.fetchone()
+    if not total:
+        return "You haven't started any charging sessions yet."
+    return f"You've started {total} charging sessions: {completed or 0} completed and {active or 0} active right now. See 'Charging History' for details."
+
+
+INTENT_HANDLERS = {
+    "station_queue": _answer_station_queue,
+    "station_price": _answer_station_price,
+    "cheapest_station": _answer_cheapest_station,
+    "greenest_station": _answer_greenest_station,
+    "my_last_session": _answer_my_last_session,
+    "my_spending": _answer_my_spending,
+    "my_sessions": _answer_my_sessions,
+}
+
+USER_INTENTS = {"my_last_session", "my_spending", "my_sessions"}
+
+
+def answer_from_data(user_message, user_id=None):
+    """
+    Answer data questions with indexed queries and templated text, no model call
+    Returns: answer text, or None when the message should go to the model
+    """
+    intent = classify_intent(user_message)
+    if intent is None or (intent in USER_INTENTS and user_id is None):
+        return None
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        answer = INTENT_HANDLERS[intent](cur, user_message, user_id)
+        if answer:
+            logger.info(f"Answered '{intent}' from the database")
+        return answer
+    except Exception as e:
+        logger.error(f"Error answering intent {intent}: {e}")
+        return None
+    finally:
+        conn.close()
@@ -175,14 +175,44 @@ def add_station_coordinates(station_name, lat, lng):
     Add or update coordinates for a station
     Can be called when adding new stations
     """
+    conn = get_db()
+    cur = conn.cursor()
+    
     try:
-        # In production, store in database
-        coords_db = _get_station_coordinates()
-        coords_db[station_name] = {"lat": lat, "lng": lng}
+        cur.execute("""
+            UPDATE stations SET latitude = ?, longitude = ? WHERE name = ?
+        """, (lat, lng, station_name))
+        conn.commit()
         return True
     except Exception as e:
         logger.error(f"Error adding coordinates: {e}")
         return False
+    finally:
+        conn.close()
+
+
+def sync_station_coordinates(station_name=None):
+    """
+    Backfill stations.latitude/longitude from the known coordinate list
+    Only fills rows that have no coordinates yet, so stored values win
+    station_name limits the backfill to that one station
+    """
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        for name, coords in _get_station_coordinates().items():
+            if station_name and name != station_name:
+                continue
+            cur.execute("""
+                UPDATE stations SET latitude = ?, longitude = ?
+                WHERE name = ? AND latitude IS NULL
+            """, (coords["lat"], coords["lng"], name))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Error syncing station coordinates: {e}")
+    finally:
+        conn.close()
 
 
 def get_map_config():
@@ -1,8 +1,17 @@
-import google.genai as genai
 import os
+import re
 import json
+import time
 import logging
+import threading
 from dotenv import load_dotenv
+from ai.gemini import GEMINI_MODEL, get_client
+from math import cos, radians
+from models.db import get_db
+from ai.cache import LRUCache
+from ai.map_utils import calculate_distance
+from ai.fuzzy_search import fuzzy_search_stations, known_station_terms
+from ai.singleflight import ai_requests
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,6 +24,67 @@ if GEMINI_API_KEY:
 else:
     logger.warning("⚠️ GEMINI_API_KEY not set for NL Query")
 
+# Parsed filters are cached per normalized query: an in-process LRU in front
+# of the nl_query_cache table, so repeat phrasings never reach Gemini
+QUERY_CACHE_TTL = int(os.getenv("NL_QUERY_CACHE_TTL", 24 * 60 * 60))
+_memory_cache = LRUCache(max_entries=512, ttl_seconds=QUERY_CACHE_TTL)
+_disk_stats = {"hits": 0, "misses": 0, "writes": 0}
+_disk_stats_lock = threading.Lock()
+
+DEFAULT_RESULT_LIMIT = 20
+TEXT_MATCH_LIMIT = 200
+KM_PER_DEGREE = 111.045
+
+# ORDER BY clauses for each sort_by value the parser can emit
+SORT_ORDERS = {
+    "green_score": "s.green_score DESC, s.price ASC",
+    "price": "s.price ASC, s.green_score DESC",
+    "availability": "available_chargers DESC, s.chargers DESC",
+    "chargers": "s.chargers DESC, s.price ASC",
+}
+
+
+# Words that describe filters rather than a place or station name
+SEARCH_STOPWORDS = {
+    "a", "an", "the", "me", "my", "i", "in", "at", "on", "of", "to", "for", "with", "within", "and", "or",
+    "near", "nearby", "nearest", "around", "close", "closest", "by", "find", "show", "need", "want",
+    "any", "some", "is", "are", "there", "where", "which", "what", "best", "good", "top", "under", "below",
+    "over", "above", "less", "more", "than", "high", "low", "score", "multiple", "available", "availability",
+    "station", "stations", "charger", "chargers", "charging", "charge", "ev", "point", "points",
+    "green", "eco", "friendly", "environment", "renewable", "clean", "cheap", "cheapest", "budget",
+    "affordable", "inexpensive", "cost", "price", "fast", "fastest", "quick", "rapid", "speed",
+    "km", "kms", "kilometer", "kilometers", "mile", "miles", "rs", "rupee", "rupees",
+    "how", "long", "much", "many", "does", "do", "can", "could", "when", "queue", "wait", "waiting",
+    "today", "now", "right", "it", "this", "that", "please", "tell", "about", "busy", "open", "free",
+    "place", "places", "spot", "spots", "plug", "plugs", "rated", "rating", "least", "most", "pls", "plz",
+}
+
+
+def extract_text_terms(query, consumed=()):
+    """
+    Pull the free-text part of a query (area, landmark, station name)
+    "chargers near Koramangala" -> "koramangala"
+    consumed: parts of the query already turned into filters, left out of the terms
+    Only words that match some station name or location word are kept.
+    Returns: space-separated terms or None
+    """
+    text = normalize_query(query)
+    for part in consumed:
+        text = text.replace(normalize_query(part), " ")
+    terms = [
+        word for word in text.replace(".", " ").split()
+        if word not in SEARCH_STOPWORDS and not re.match(r"^\d+(km|kms|rs)?$", word)
+    ]
+    terms = known_station_terms(" ".join(terms)) if terms else []
+    return " ".join(terms) if terms else None
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace so equivalent phrasings share a cache key"""
+    text = query.lower().replace("₹", " rs ")
+    text = re.sub(r"[^a-z0-9.\s]", " ", text)
+    return " ".join(text.split())
+
 
 def parse_natural_language_query(query):
     """
@@ -38,6 +108,29 @@ def parse_natural_language_query(query):
     if not GEMINI_API_KEY:
         return _parse_fallback_query(query)
     
+    cache_key = normalize_query(query)
+    cached = _get_cached_filters(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Concurrent misses for the same normalized query share one Gemini call
+    filters = ai_requests.do(("nl_query", cache_key), _parse_and_cache, query, cache_key)
+    return dict(filters)
+
+
+def _parse_and_cache(query, cache_key):
+    filters = _parse_with_gemini(query)
+    
+    # Only model output is worth caching; the fallback parser is already cheap
+    if filters.get("query_method") == "ai":
+        _store_cached_filters(cache_key, filters)
+    
+    return filters
+
+
+def _parse_with_gemini(query):
+    """Ask Gemini to turn the query into filters, falling back to keywords on failure"""
+    
     try:
         prompt = f"""Parse this EV charging station search query into structured filters.
 
@@ -53,7 +146,8 @@ Return ONLY a JSON object (no markdown, no extra text) with these fields:
     "min_chargers": <number or null>,
     "fast_charging": <true/false>,
     "sort_by": "green_score|price|distance|availability",
-    "intent": "cheapest|greenest|fastest|nearest|balanced"
+    "intent": "cheapest|greenest|fastest|nearest|balanced",
+    "text_query": <area, landmark or station name words mentioned, or null>
 }}
 
 Rules:
@@ -62,11 +156,11 @@ Rules:
 - If "fast" or "quick" mentioned: fast_charging = true
 - If distance mentioned (km, near): extract max_distance
 - If price mentioned: extract price_max
+- If a place or station name is mentioned (e.g. "near Koramangala"): put it in text_query
 - Only return valid JSON, no extra text"""
         
-        client = genai.Client()
-        response = client.models.generate_content(
-            model="models/gemini-2.0-flash",
+        response = get_client().models.generate_content(
+            model=GEMINI_MODEL,
             contents=prompt,
             config={"temperature": 0.3}
         )
@@ -84,6 +178,9 @@ Rules:
                 
                 filters = json.loads(text.strip())
                 filters["query_method"] = "ai"
+                # An explicit null means the model saw no place or name; only guess when the key is missing
+                if "text_query" not in filters:
+                    filters["text_query"] = extract_text_terms(query)
                 filters["natural_explanation"] = _generate_explanation(query, filters)
                 return filters
             except json.JSONDecodeError:
@@ -97,6 +194,88 @@ Rules:
         return _parse_fallback_query(query)
 
 
+def _get_cached_filters(cache_key):
+    """Look up parsed filters in the memory tier, then the SQLite tier"""
+    
+    filters = _memory_cache.get(cache_key)
+    if filters is not None:
+        return dict(filters)
+    
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            SELECT filters, created_at FROM nl_query_cache WHERE query_key = ?
+        """, (cache_key,))
+        row = cur.fetchone()
+        
+        if row and row[1] + QUERY_CACHE_TTL > time.time():
+            filters = json.loads(row[0])
+            # Promote to memory for the remaining lifetime of the disk entry
+            _memory_cache.set(cache_key, filters, ttl_seconds=row[1] + QUERY_CACHE_TTL - time.time())
+            with _disk_stats_lock:
+                _disk_stats["hits"] += 1
+            return dict(filters)
+        
+        with _disk_stats_lock:
+            _disk_stats["misses"] += 1
+        return None
+        
+    except Exception as e:
+        logger.error(f"Error reading NL query cache: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def _store_cached_filters(cache_key, filters):
+    """Write parsed filters to both cache tiers and drop expired disk entries"""
+    
+    _memory_cache.set(cache_key, dict(filters))
+    
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        now = time.time()
+        cur.execute("""
+            INSERT OR REPLACE INTO nl_query_cache (query_key, filters, created_at)
+            VALUES (?, ?, ?)
+        """, (cache_key, json.dumps(filters), now))
+        cur.execute("DELETE FROM nl_query_cache WHERE created_at < ?", (now - QUERY_CACHE_TTL,))
+        conn.commit()
+        with _disk_stats_lock:
+            _disk_stats["writes"] += 1
+    except Exception as e:
+        logger.error(f"Error writing NL query cache: {e}")
+    finally:
+        conn.close()
+
+
+def get_query_cache_stats():
+    """Hit/miss counters for both cache tiers and the overall hit rate"""
+    
+    memory = _memory_cache.stats()
+    with _disk_stats_lock:
+        disk = dict(_disk_stats)
+    
+    # Every memory miss falls through to disk, so disk misses are model calls
+    lookups = memory["hits"] + memory["misses"]
+    hits = memory["hits"] + disk["hits"]
+    disk_lookups = disk["hits"] + disk["misses"]
+    disk["hit_rate"] = round(disk["hits"] / disk_lookups, 3) if disk_lookups else 0.0
+    
+    return {
+        "memory": memory,
+        "disk": disk,
+        "lookups": lookups,
+        "model_calls_saved": hits,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "ttl_seconds": QUERY_CACHE_TTL
+    }
+
+
 def _parse_fallback_query(query):
     """Fallback parser when Gemini API is unavailable"""
     
@@ -120,15 +299,18 @@ def _parse_fallback_query(query):
         filters["sort_by"] = "green_score"
         filters["intent"] = "greenest"
     
+    # Query text turned into filters below, kept out of the free-text terms
+    consumed = []
+    
     # Cheap/Budget check
     if any(word in query_lower for word in ["cheap", "budget", "affordable", "inexpensive", "cost", "price"]):
         filters["sort_by"] = "price"
         filters["intent"] = "cheapest"
         # Try to extract price
-        import re
         price_match = re.search(r'(\d+)\s*(rupees?|rs|₹)', query_lower)
         if price_match:
             filters["price_max"] = int(price_match.group(1))
+            consumed.append(price_match.group(0))
     
     # Fast/Quick check
     if any(word in query_lower for word in ["fast", "quick", "quick", "rapid", "speed"]):
@@ -136,13 +318,20 @@ def _parse_fallback_query(query):
         filters["sort_by"] = "availability"
     
     # Distance check
-    import re
     distance_match = re.search(r'(\d+)\s*(km|kilometer|mile)', query_lower)
     if distance_match:
         distance = int(distance_match.group(1))
         filters["max_distance"] = distance if "km" in query_lower else distance * 1.6
-    else:
-        filters["max_distance"] = 10  # Default to 10km if not specified
+        consumed.append(distance_match.group(0))
+    
+    # Charger count check
+    chargers_match = re.search(r'(at least|minimum of|minimum|min|more than|over)\s+(\d+)\s*(chargers?|charging points?|points?)', query_lower)
+    if chargers_match:
+        count = int(chargers_match.group(2))
+        filters["min_chargers"] = count + 1 if chargers_match.group(1) in ("more than", "over") else count
+        consumed.append(chargers_match.group(0))
+    
+    filters["text_query"] = extract_text_terms(query, consumed)
     
     filters["natural_explanation"] = _generate_explanation(query, filters)
     return filters
@@ -174,6 +363,9 @@ def _generate_explanation(query, filters):
     if filters.get("fast_charging"):
         parts.append("with fast charging")
     
+    if filters.get("text_query"):
+        parts.append(f"matching \"{filters['text_query']}\"")
+    
     return " ".join(parts) if parts else "Searching for charging stations"
 
 
@@ -217,27 +409,221 @@ def apply_filters_to_stations(stations, filters):
     return filtered
 
 
-def search_with_natural_language(query, all_stations):
+def search_station_text(text, limit=TEXT_MATCH_LIMIT):
+    """
+    Prefix full-text match over station names and locations (stations_fts)
+    Terms are OR-ed so one unknown word does not hide real matches;
+    BM25 ranks stations matching more (and rarer) terms first, name hits weighted above location hits
+    
+    Returns: list of (station_id, rank) tuples, best first (lower rank is better)
+    """
+    
+    terms = re.findall(r"\w+", (text or "").lower())
+    if not terms:
+        return []
+    
+    match_expr = " OR ".join(f'"{term}"*' for term in terms)
+    
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            SELECT rowid, bm25(stations_fts, 10.0, 5.0) AS rank
+            FROM stations_fts
+            WHERE stations_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match_expr, limit))
+        return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Error running station text search: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def build_station_query(filters, user_location=None, limit=DEFAULT_RESULT_LIMIT, text_hits=None):
+    """
+    Compile parsed filters into a parameterized SQL query over approved stations
+    filters: output from parse_natural_language_query()
+    user_location: optional (lat, lng) shared by the browser
+    text_hits: optional (station_id, rank) list from search_station_text(); restricts
+               results to those stations and ranks by relevance unless an explicit sort was asked for
+    
+    Returns: (sql, params)
+    Rows: (name, location, chargers, price, green_score, available_chargers, latitude, longitude)
+    """
+    
+    clauses = ["s.approved = 1"]
+    params = []
+    
+    if filters.get("green_score_min"):
+        clauses.append("s.green_score >= ?")
+        params.append(filters["green_score_min"])
+    
+    if filters.get("green_score_max"):
+        clauses.append("s.green_score <= ?")
+        params.append(filters["green_score_max"])
+    
+    if filters.get("price_max"):
+        clauses.append("s.price <= ?")
+        params.append(filters["price_max"])
+    
+    if filters.get("price_min"):
+        clauses.append("s.price >= ?")
+        params.append(filters["price_min"])
+    
+    if filters.get("min_chargers"):
+        clauses.append("s.chargers >= ?")
+        params.append(filters["min_chargers"])
+    
+    # Fast charging means a charger is free right now - no waiting in the queue
+    if filters.get("fast_charging"):
+        clauses.append("s.chargers > (SELECT COUNT(*) FROM charging_sessions cs WHERE cs.station_name = s.name AND cs.status = 'Active')")
+    
+    distance_order = None
+    if user_location:
+        lat, lng = user_location
+        lng_scale = max(cos(radians(lat)), 0.01)
+        # Equirectangular squared distance in degrees of latitude - cheap, monotonic enough to rank
+        distance_order = "((s.latitude - ?) * (s.latitude - ?) + (s.longitude - ?) * (s.longitude - ?) * ?)"
+        distance_params = [lat, lat, lng, lng, lng_scale * lng_scale]
+        
+        if filters.get("max_distance"):
+            # Bounding box hits the (approved, latitude, longitude) index, then trim the corners
+            lat_delta = filters["max_distance"] / KM_PER_DEGREE
+            lng_delta = lat_delta / lng_scale
+            clauses.append("s.latitude BETWEEN ? AND ?")
+            params.extend([lat - lat_delta, lat + lat_delta])
+            clauses.append("s.longitude BETWEEN ? AND ?")
+            params.extend([lng - lng_delta, lng + lng_delta])
+            clauses.append(f"{distance_order} <= ?")
+            params.extend(distance_params + [lat_delta * lat_delta])
+    
+    text_cte = ""
+    text_join = ""
+    text_params = []
+    if text_hits:
+        text_cte = "WITH text_hits(station_id, text_rank) AS (VALUES " + ", ".join("(?, ?)" for _ in text_hits) + ")"
+        text_join = "JOIN text_hits t ON t.station_id = s.id"
+        for station_id, rank in text_hits:
+            text_params.extend([station_id, rank])
+    
+    sort_by = filters.get("sort_by", "distance")
+    if sort_by == "distance" and distance_order:
+        order_by = f"{distance_order} ASC"
+        order_params = distance_params
+    elif sort_by in SORT_ORDERS:
+        order_by = SORT_ORDERS[sort_by]
+        order_params = []
+    elif text_hits:
+        order_by = "t.text_rank ASC, s.green_score DESC"
+        order_params = []
+    else:
+        order_by = "s.green_score DESC, s.price ASC"
+        order_params = []
+    
+    sql = f"""
+        {text_cte}
+        SELECT s.name, s.location, s.chargers, s.price, s.green_score,
+               s.chargers - (SELECT COUNT(*) FROM charging_sessions cs
+                             WHERE cs.station_name = s.name AND cs.status = 'Active') AS available_chargers,
+               s.latitude, s.longitude
+        FROM stations s
+        {text_join}
+        WHERE {" AND ".join(clauses)}
+        ORDER BY {order_by}
+        LIMIT ?
+    """
+    
+    return sql, text_params + params + order_params + [limit]
+
+
+def search_stations(filters, user_location=None, limit=DEFAULT_RESULT_LIMIT):
+    """
+    Run the compiled filter query and attach exact distances
+    
+    Returns: list of (name, location, chargers, price, green_score, available_chargers, distance_km) tuples
+    distance_km is None when no location was shared or the station has no coordinates
+    """
+    
+    # Free text narrows the candidates to indexed name/location matches, falling back to
+    # trigram matches for misspellings; if neither matches (e.g. a filler word slipped
+    # through) search on the structured filters alone
+    text_hits = None
+    # Model output and cached filters may still carry words no station uses
+    text_query = " ".join(known_station_terms(filters["text_query"])) if filters.get("text_query") else ""
+    if text_query:
+        text_hits = search_station_text(text_query)
+        if not text_hits:
+            text_hits = [
+                (station_id, -score)
+                for station_id, _, _, score in fuzzy_search_stations(text_query, limit=TEXT_MATCH_LIMIT)
+            ]
+    
+    sql, params = build_station_query(filters, user_location, limit, text_hits=text_hits)
+    
+    conn = get_db()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    except Exception as e:
+        logger.error(f"Error searching stations: {e}")
+        return []
+    finally:
+        conn.close()
+    
+    results = []
+    for name, location, chargers, price, green_score, available, lat, lng in rows:
+        distance = None
+        if user_location and lat is not None and lng is not None:
+            distance = round(calculate_distance(user_location[0], user_location[1], lat, lng), 2)
+        results.append((name, location, chargers, price, green_score, available, distance))
+    
+    return results
+
+
+def search_with_natural_language(query, all_stations=None, user_location=None, limit=DEFAULT_RESULT_LIMIT):
     """
     End-to-end natural language search
     query: user input like "Find me a green station near me"
-    all_stations: list of station tuples
+    all_stations: optional list of station tuples to filter in memory;
+                  when omitted the filters are pushed down to SQL
+    user_location: optional (lat, lng) used for max_distance and distance sorting
     
     Returns: {
         "explanation": "Searching for eco-friendly stations within 10km",
         "filters": {...},
         "results": [stations],
-        "result_count": N
+        "result_count": N,
+        "notice": message when a parsed filter could not be applied, else None
     }
     """
     
     filters = parse_natural_language_query(query)
-    results = apply_filters_to_stations(all_stations, filters)
+    # Cached filters from before text search existed carry no text_query
+    filters.setdefault("text_query", extract_text_terms(query))
+    
+    if all_stations is not None:
+        results = apply_filters_to_stations(all_stations, filters)
+    else:
+        results = search_stations(filters, user_location, limit)
+    
+    # Distance needs the browser's location and the SQL path; say so rather
+    # than quietly returning stations at any distance
+    notice = None
+    if filters.get("max_distance") and (not user_location or all_stations is not None):
+        notice = (f"Share your location to search within {filters['max_distance']:g} km; "
+                  f"showing stations at any distance.")
     
     return {
         "explanation": filters.get("natural_explanation"),
         "filters": filters,
         "results": results,
         "result_count": len(results),
-        "query_method": filters.get("query_method")
+        "query_method": filters.get("query_method"),
+        "notice": notice
     }
@@ -1,8 +1,9 @@
-import google.generativeai as genai
 import os
 import json
 import logging
 from dotenv import load_dotenv
+from ai.gemini import GEMINI_MODEL, get_client
+from ai.singleflight import ai_requests
 
 # Load environment variables from .env file
 load_dotenv()
@@ -44,8 +45,10 @@ def recommend_station(battery, distance, stations):
     reachable_stations.sort(reverse=True, key=lambda x: x[0])
     best_station = reachable_stations[0][1]
     
-    # Generate AI explanation using Gemini if API is configured
-    explanation = _generate_ai_explanation(battery, distance, best_station, reachable_stations)
+    # Generate AI explanation using Gemini if API is configured;
+    # identical concurrent requests share one in-flight call
+    flight_key = ("recommend", battery, distance, tuple(s for _, s in reachable_stations[:5]))
+    explanation = ai_requests.do(flight_key, _generate_ai_explanation, battery, distance, best_station, reachable_stations)
     
     return best_station, explanation
 
@@ -97,9 +100,8 @@ Please provide:
 
 Keep the response concise and practical. Format as JSON with keys: "why", "benefits", "tip"."""
         
-        client = genai.Client()
-        response = client.models.generate_content(
-            model="models/gemini-2.0-flash",
+        response = get_client().models.generate_content(
+            model=GEMINI_MODEL,
             contents=prompt,
             config={"temperature": 0.7}
         )
@@ -0,0 +1,157 @@
+import re
+import time
+import random
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+SIMILARITY_THRESHOLD = 0.6
+MAX_ENTRIES = 1000
+TTL_SECONDS = 6 * 60 * 60
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20260123)
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_HASHES)]
+
+# Words that carry no meaning for matching questions to each other
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "i", "me", "my", "you", "your", "we", "our", "it", "its",
+    "do", "does", "did", "can", "could", "would", "should", "will", "to", "of", "in", "on", "at", "for",
+    "and", "or", "with", "about", "what", "how", "why", "which", "please", "any", "there", "this", "that",
+    "when", "where", "who", "so", "if", "am", "im", "has", "have", "had", "from", "by", "get", "just", "also",
+}
+
+
+def _stem(word):
+    # Crude suffix stripping is enough to line up "stations"/"station", "charging"/"charge"
+    for suffix in ("ing", "es", "s", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize_message(message):
+    """Normalized content words of a message"""
+    words = re.findall(r"[a-z0-9]+", message.lower())
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+
+def _shingles(tokens):
+    """Unigrams plus bigrams, so word order counts a little but not too much"""
+    shingles = set(tokens)
+    shingles.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return shingles
+
+
+def _minhash(shingles):
+    hashed = [zlib.crc32(sh.encode()) for sh in shingles]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashed) for a, b in _HASH_PARAMS)
+
+
+class ResponseCache:
+    """
+    Near-duplicate chatbot answer cache
+    Messages are reduced to unigram+bigram shingles and MinHash signatures; LSH
+    banding finds candidate entries in O(bands) and the exact Jaccard similarity
+    of the shingle sets decides the hit. Entries expire after ttl_seconds and the
+    least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()       # entry id -> (namespace, shingles, bucket keys, response, expires_at)
+        self._buckets = defaultdict(set)    # (namespace, band, band values) -> entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _bucket_keys(self, namespace, signature):
+        return [
+            (namespace, band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+            for band in range(BANDS)
+        ]
+
+    def _drop(self, entry_id):
+        namespace, shingles, bucket_keys, response, expires_at = self._entries.pop(entry_id)
+        for key in bucket_keys:
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[key]
+
+    def lookup(self, message, namespace=""):
+        """Cached response for the most similar earlier message in namespace, or None"""
+        shingles = _shingles(tokenize_message(message))
+        if not shingles:
+            return None
+        signature = _minhash(shingles)
+
+        with self._lock:
+            candidates = set()
+            for key in self._bucket_keys(namespace, signature):
+                candidates |= self._buckets.get(key, set())
+
+            now = time.time()
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                _, entry_shingles, _, _, expires_at = self._entries[entry_id]
+                if expires_at < now:
+                    self._drop(entry_id)
+                    continue
+                similarity = len(shingles & entry_shingles) / len(shingles | entry_shingles)
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def store(self, message, response, namespace=""):
+        shingles = _shingles(tokenize_message(message))
+        if not shingles or not response:
+            return
+        bucket_keys = self._bucket_keys(namespace, _minhash(shingles))
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, shingles, bucket_keys, response, time.time() + self.ttl_seconds)
+            for key in bucket_keys:
+                self._buckets[key].add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.threshold
+        }
+
+
+response_cache = ResponseCache()
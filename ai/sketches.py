@@ -0,0 +1,213 @@
+import json
+import logging
+import math
+import random
+from datetime import datetime
+from ai.cache import LRUCache
+from models.db import get_db
+
+logger = logging.getLogger(__name__)
+
+SKETCH_K = 200
+FETCH_SIZE = 5000
+# Sketches only change when the nightly batch rebuilds them
+SKETCH_CACHE_SECONDS = 300
+
+# Per-user metrics ranked across users: SQL over user_stats, the same value
+# from a models.charging.get_user_stats() dict, and which users count
+USER_METRICS = {
+    "user_green_score": (
+        "green_units / rated_units", "rated_units > 0",
+        lambda s: s["green_units"] / s["rated_units"] if s["rated_units"] else None
+    ),
+    "user_cost_per_session": (
+        "spend * 1.0 / completed", "completed > 0",
+        lambda s: s["spend"] / s["completed"] if s["completed"] else None
+    ),
+    "user_sessions": (
+        "completed", "completed > 0",
+        lambda s: s["completed"] or None
+    ),
+}
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016)
+    Keeps O(k log n) items in levels of compactors; an item at level h stands
+    for 2^h inputs. Rank error is about 1.7/k with high probability, and two
+    sketches merge into one with the same guarantee.
+    """
+
+    def __init__(self, k=SKETCH_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _size(self):
+        return sum(len(items) for items in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    items.sort()
+                    # An odd item out stays behind; every other item of the rest moves up
+                    keep = [items.pop()] if len(items) % 2 else []
+                    offset = self._rng.randint(0, 1)
+                    self.compactors[level + 1].extend(items[offset::2])
+                    self.compactors[level] = keep
+                    break
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def rank(self, value, inclusive=False):
+        """Estimated number of inputs below (or at, if inclusive) value"""
+        if inclusive:
+            return sum(sum(1 for item in items if item <= value) << level for level, items in enumerate(self.compactors))
+        return sum(sum(1 for item in items if item < value) << level for level, items in enumerate(self.compactors))
+
+    def percentile(self, value, inclusive=False):
+        """Share of inputs below (or at, if inclusive) value, 0-100"""
+        weight = sum(len(items) << level for level, items in enumerate(self.compactors))
+        return 100.0 * self.rank(value, inclusive) / weight if weight else None
+
+    def quantile(self, q):
+        weighted = sorted((item, 1 << level) for level, items in enumerate(self.compactors) for item in items)
+        if not weighted:
+            return None
+        target = q * sum(weight for _, weight in weighted)
+        seen = 0
+        for item, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return item
+        return weighted[-1][0]
+
+    def to_json(self):
+        return json.dumps({"k": self.k, "count": self.count, "compactors": self.compactors})
+
+    @classmethod
+    def from_json(cls, payload):
+        data = json.loads(payload)
+        sketch = cls(data["k"])
+        sketch.count = data["count"]
+        sketch.compactors = data["compactors"]
+        return sketch
+
+
+# ===============================
+# PERSISTED USER SKETCHES
+# ===============================
+_sketch_cache = LRUCache(max_entries=len(USER_METRICS) * 2, ttl_seconds=SKETCH_CACHE_SECONDS)
+
+
+def build_user_sketches(cur, k=SKETCH_K):
+    """
+    One chunked pass over user_stats per metric
+    Returns: dict metric -> KLLSketch
+    """
+    sketches = {}
+    for metric, (expression, condition, _) in USER_METRICS.items():
+        sketch = KLLSketch(k)
+        cur.execute(f"SELECT {expression} FROM user_stats WHERE {condition}")
+        while True:
+            chunk = cur.fetchmany(FETCH_SIZE)
+            if not chunk:
+                break
+            for (value,) in chunk:
+                sketch.update(value)
+        sketches[metric] = sketch
+    return sketches
+
+
+def write_sketches(cur, sketches):
+    """Replace persisted sketches on the caller's transaction"""
+    updated_at = datetime.utcnow().isoformat()
+    cur.executemany("""
+        INSERT INTO metric_sketches (metric, sketch, count, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(metric) DO UPDATE SET
+            sketch = excluded.sketch, count = excluded.count, updated_at = excluded.updated_at
+    """, [(metric, sketch.to_json(), sketch.count, updated_at) for metric, sketch in sketches.items()])
+    _sketch_cache.clear()
+
+
+def run_user_sketches():
+    """
+    Batch job: rebuild every per-user metric sketch from user_stats
+    User metrics move as people keep charging and a sketch cannot forget an
+    input, so sketches are rebuilt whole rather than patched.
+    Returns: dict metric -> users in the sketch
+    """
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        sketches = build_user_sketches(cur)
+        write_sketches(cur, sketches)
+        conn.commit()
+        return {metric: sketch.count for metric, sketch in sketches.items()}
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error building user sketches: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+def load_sketch(cur, metric):
+    sketch = _sketch_cache.get(metric)
+    if sketch is None:
+        cur.execute("SELECT sketch FROM metric_sketches WHERE metric = ?", (metric,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        sketch = KLLSketch.from_json(row[0])
+        _sketch_cache.set(metric, sketch)
+    return sketch
+
+
+def user_percentiles(cur, stats):
+    """
+    Where a user stands among all users, per metric
+    stats: dict from models.charging.get_user_stats()
+    Returns: dict metric -> {"below": % of users strictly below, "above": % strictly above},
+    or None when there is no sketch (or no value) to compare with
+    """
+    percentiles = {}
+    for metric, (_, _, value_of) in USER_METRICS.items():
+        value = value_of(stats)
+        sketch = load_sketch(cur, metric) if value is not None else None
+        # A sketch of one user says nothing about the others
+        if sketch is None or sketch.count < 2:
+            percentiles[metric] = None
+            continue
+        percentiles[metric] = {
+            "below": round(sketch.percentile(value)),
+            "above": round(100 - sketch.percentile(value, inclusive=True))
+        }
+    return percentiles
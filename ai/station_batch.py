@@ -0,0 +1,193 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import groupby
+from models.db import get_db
+from ai.sketches import build_user_sketches, write_sketches
+from ai.forecasting import HISTORY_WEEKS, HORIZON_HOURS, forecast_rows, load_hourly_history, write_forecasts
+from ai.utilization import (
+    UTILIZATION_DAYS, session_interval, station_utilization_rows, utilization_window, write_utilization
+)
+
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 10000
+# Tables the batch can rebuild; scripts/forecast_demand.py and
+# scripts/compute_utilization.py run the batch for one of them
+BATCH_OUTPUTS = ("forecasts", "utilization", "sketches")
+
+
+def _partition_stations(stations, partitions):
+    """Greedy largest-first split of (name, chargers, weight) so partitions carry similar session counts"""
+    buckets = [[] for _ in range(partitions)]
+    loads = [0] * partitions
+    for name, chargers, weight in sorted(stations, key=lambda s: -s[2]):
+        i = loads.index(min(loads))
+        buckets[i].append((name, chargers))
+        loads[i] += weight
+    return [bucket for bucket in buckets if bucket]
+
+
+def compute_partition(stations, now_iso, weeks=HISTORY_WEEKS, utilization_days=UTILIZATION_DAYS,
+                      horizon=HORIZON_HOURS, outputs=BATCH_OUTPUTS):
+    """
+    Worker: forecasts and utilization for a set of (name, chargers) stations
+    Forecast history comes from session_rollup_hourly; utilization needs session
+    intervals, so the window's sessions are read in one ordered, chunked pass.
+    Returns: dict of forecast and utilization rows plus the number of rows read
+    """
+    now = datetime.fromisoformat(now_iso)
+    chargers_of = dict(stations)
+    names = list(chargers_of)
+    rows_read = 0
+    forecasts, daily_rows, period_rows = [], [], []
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        if "forecasts" in outputs:
+            history_end = now.replace(minute=0, second=0, microsecond=0)
+            history, rollup_rows = load_hourly_history(cur, names, history_end, weeks)
+            rows_read += rollup_rows
+            forecasts = forecast_rows(names, history, history_end, horizon)
+
+        if "utilization" in outputs:
+            window_start, window_end = utilization_window(utilization_days, now)
+            intervals = {name: [] for name in names}
+
+            cur.execute("CREATE TEMP TABLE batch_stations (name TEXT PRIMARY KEY)")
+            cur.executemany("INSERT INTO batch_stations (name) VALUES (?)", [(name,) for name in names])
+            # Sessions can last longer than a day, so look back one extra day
+            cur.execute("""
+                SELECT cs.station_name, cs.started_at, cs.completed_at, cs.duration_minutes, cs.status
+                FROM charging_sessions cs
+                JOIN batch_stations b ON b.name = cs.station_name
+                WHERE cs.started_at >= ?
+                ORDER BY cs.station_name
+            """, ((window_start - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"),))
+
+            while True:
+                chunk = cur.fetchmany(FETCH_SIZE)
+                if not chunk:
+                    break
+                rows_read += len(chunk)
+                for station_name, group in groupby(chunk, key=lambda r: r[0]):
+                    station = intervals[station_name]
+                    for _, started_at, completed_at, duration, status in group:
+                        interval = session_interval(started_at, completed_at, duration, status, window_end)
+                        if interval:
+                            station.append(interval)
+
+            for name in names:
+                station_daily, station_periods = station_utilization_rows(
+                    name, chargers_of[name], intervals[name], window_start, window_end)
+                daily_rows.extend(station_daily)
+                period_rows.extend(station_periods)
+    finally:
+        conn.close()
+
+    return {
+        "rows_read": rows_read,
+        "forecasts": forecasts,
+        "utilization_daily": daily_rows,
+        "saturation_periods": period_rows
+    }
+
+
+def run_nightly_batch(workers=None, weeks=HISTORY_WEEKS, utilization_days=UTILIZATION_DAYS,
+                      horizon=HORIZON_HOURS, outputs=BATCH_OUTPUTS):
+    """
+    Compute demand forecasts and charger utilization for every approved
+    station, and rebuild the per-user percentile sketches
+    The only writer of station_forecasts, the utilization rollups and
+    metric_sketches; outputs limits a run to some of them. Stations are split
+    across a process pool by session volume and the parent writes every
+    requested table in one transaction. Peak hours, unit price and durations
+    are not stored: ai/analytics serves them from the hourly rollup.
+    Returns: dict with counts and timings
+    """
+    outputs = tuple(output for output in BATCH_OUTPUTS if output in outputs)
+    started = time.perf_counter()
+    # Session timestamps default to CURRENT_TIMESTAMP, which is UTC
+    now = datetime.utcnow().replace(microsecond=0)
+    workers = workers or os.cpu_count() or 1
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT s.name, s.chargers, COALESCE(SUM(r.sessions), 0)
+            FROM stations s
+            LEFT JOIN session_rollup_hourly r ON r.station_name = s.name
+            WHERE s.approved = 1
+            GROUP BY s.name
+        """)
+        stations = cur.fetchall()
+    finally:
+        conn.close()
+
+    # One partition per worker, balanced by session volume; larger partitions
+    # also keep the forecast fit vectorized over more stations at once. A
+    # sketches-only run needs no partitions at all.
+    station_outputs = [output for output in outputs if output != "sketches"]
+    partitions = _partition_stations(stations, min(len(stations), workers)) if station_outputs and stations else []
+
+    results = []
+    compute_started = time.perf_counter()
+    args = (now.isoformat(), weeks, utilization_days, horizon, outputs)
+    if workers == 1 or len(partitions) <= 1:
+        results = [compute_partition(p, *args) for p in partitions]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(compute_partition, p, *args) for p in partitions]
+            results = [future.result() for future in futures]
+    compute_seconds = time.perf_counter() - compute_started
+
+    write_started = time.perf_counter()
+    window_start, _ = utilization_window(utilization_days, now)
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        if "forecasts" in outputs:
+            write_forecasts(cur, [row for result in results for row in result["forecasts"]])
+        if "utilization" in outputs:
+            write_utilization(
+                cur,
+                [row for result in results for row in result["utilization_daily"]],
+                [row for result in results for row in result["saturation_periods"]],
+                window_start
+            )
+        sketches = {}
+        if "sketches" in outputs:
+            # Per-user percentile sketches from user_stats, committed with the station tables
+            sketches = build_user_sketches(cur)
+            write_sketches(cur, sketches)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error writing nightly analytics: {e}")
+        raise
+    finally:
+        conn.close()
+    write_seconds = time.perf_counter() - write_started
+
+    elapsed = time.perf_counter() - started
+    rows_read = sum(result["rows_read"] for result in results)
+    return {
+        "stations": len(stations),
+        "outputs": list(outputs),
+        "workers": min(workers, len(partitions)),
+        "partitions": len(partitions),
+        "rows_read": rows_read,
+        "compute_seconds": round(compute_seconds, 2),
+        "write_seconds": round(write_seconds, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "rows_per_second": round(rows_read / compute_seconds, 1) if compute_seconds else 0.0,
+        "forecast_rows": sum(len(result["forecasts"]) for result in results),
+        "utilization_rows": sum(len(result["utilization_daily"]) for result in results),
+        "saturation_periods": sum(len(result["saturation_periods"]) for result in results),
+        "sketch_users": max((sketch.count for sketch in sketches.values()), default=0)
+    }
@@ -0,0 +1,181 @@
+import json
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from models.db import get_db
+
+logger = logging.getLogger(__name__)
+
+UTILIZATION_DAYS = 30
+# A start this soon after a saturated period ends was most likely waiting in the queue
+QUEUE_HANDOFF_MINUTES = 5
+
+
+def parse_ts(ts):
+    if not ts:
+        return None
+    try:
+        return datetime.fromisoformat(str(ts))
+    except ValueError:
+        try:
+            return datetime.strptime(str(ts).split('.')[0], "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+
+
+def session_interval(started_at, completed_at, duration_minutes, status, now):
+    """(start, end) a session occupied a charger, or None if it cannot be placed"""
+    start = parse_ts(started_at)
+    if start is None:
+        return None
+    if status == "Active":
+        return start, now
+    # duration_minutes is measured by the app itself, so prefer it to completed_at
+    if duration_minutes is not None:
+        return start, start + timedelta(minutes=max(duration_minutes, 0))
+    end = parse_ts(completed_at)
+    return (start, end) if end and end > start else None
+
+
+def sweep_station(intervals, chargers, window_start, window_end):
+    """
+    Sweep-line over session intervals of one station, O(n log n)
+    Returns: (per-day dict of minutes at 0..chargers busy, saturation periods)
+    Sessions beyond the charger count are counted at the top level.
+    """
+    chargers = max(chargers or 0, 1)
+
+    events = []
+    for start, end in intervals:
+        start, end = max(start, window_start), min(end, window_end)
+        if end > start:
+            events.append((start, 1))
+            events.append((end, -1))
+    # Ends sort before starts at the same instant, so back-to-back sessions do not overlap
+    events.sort()
+
+    days = {}
+    periods = []
+
+    def accumulate(frm, to, busy):
+        level = min(busy, chargers)
+        while frm < to:
+            day = frm.date()
+            day_end = min(to, datetime.combine(day + timedelta(days=1), datetime.min.time()))
+            levels = days.setdefault(day.isoformat(), [0.0] * (chargers + 1))
+            levels[level] += (day_end - frm).total_seconds() / 60
+            frm = day_end
+
+    busy = 0
+    previous = window_start
+    saturated_since = None
+    peak = 0
+    for at, delta in events:
+        accumulate(previous, at, busy)
+        busy += delta
+        previous = at
+
+        if busy >= chargers and saturated_since is None:
+            saturated_since, peak = at, busy
+        elif saturated_since is not None:
+            peak = max(peak, busy)
+            if busy < chargers:
+                periods.append({"start": saturated_since, "end": at, "peak_busy": peak})
+                saturated_since = None
+    accumulate(previous, window_end, busy)
+    if saturated_since is not None:
+        periods.append({"start": saturated_since, "end": window_end, "peak_busy": peak})
+
+    # Starts right after a charger freed up were served from the queue
+    starts = sorted(start for start, _ in intervals)
+    handoff = timedelta(minutes=QUEUE_HANDOFF_MINUTES)
+    for period in periods:
+        period["queued_starts"] = bisect_right(starts, period["end"] + handoff) - bisect_left(starts, period["end"])
+
+    return days, periods
+
+
+def daily_rollup_rows(station_name, chargers, days):
+    chargers = max(chargers or 0, 1)
+    rows = []
+    for day, levels in sorted(days.items()):
+        busy_minutes = sum(level * minutes for level, minutes in enumerate(levels))
+        rows.append((
+            station_name, day, chargers,
+            json.dumps([round(minutes, 1) for minutes in levels]),
+            round(busy_minutes, 1),
+            round(levels[chargers], 1),
+            round(busy_minutes / (chargers * 1440), 4)
+        ))
+    return rows
+
+
+def utilization_window(days=UTILIZATION_DAYS, now=None):
+    """(window start at midnight N-1 days ago, window end now)"""
+    # Session start times default to CURRENT_TIMESTAMP (UTC)
+    now = now or datetime.utcnow()
+    return datetime.combine((now - timedelta(days=days - 1)).date(), datetime.min.time()), now
+
+
+def station_utilization_rows(station_name, chargers, intervals, window_start, window_end):
+    """(station_utilization_daily rows, station_saturation_periods rows) for one station"""
+    day_levels, periods = sweep_station(intervals, chargers, window_start, window_end)
+    period_rows = [
+        (station_name, p["start"].strftime("%Y-%m-%d %H:%M:%S"), p["end"].strftime("%Y-%m-%d %H:%M:%S"),
+         round((p["end"] - p["start"]).total_seconds() / 60, 1), p["peak_busy"], p["queued_starts"])
+        for p in periods
+    ]
+    return daily_rollup_rows(station_name, chargers, day_levels), period_rows
+
+
+def write_utilization(cur, daily_rows, period_rows, window_start):
+    """Replace the window's utilization rollups on the caller's transaction"""
+    cur.execute("DELETE FROM station_utilization_daily WHERE day >= ?", (window_start.date().isoformat(),))
+    cur.execute("DELETE FROM station_saturation_periods WHERE ended_at >= ?", (window_start.strftime("%Y-%m-%d %H:%M:%S"),))
+    cur.executemany("""
+        INSERT INTO station_utilization_daily
+        (station_name, day, chargers, level_minutes, busy_charger_minutes, saturated_minutes, utilization)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, daily_rows)
+    cur.executemany("""
+        INSERT INTO station_saturation_periods
+        (station_name, started_at, ended_at, minutes, peak_busy, queued_starts)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, period_rows)
+
+
+def get_owner_utilization(owner_id, days=7):
+    """
+    Utilization of an owner's stations over the last N days, from the rollups
+    Returns: dict station name -> {utilization, saturated_hours, queue_windows}
+    """
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        first_day = (datetime.utcnow() - timedelta(days=days - 1)).date().isoformat()
+        cur.execute("""
+            SELECT s.name,
+                   (SELECT AVG(u.utilization) FROM station_utilization_daily u
+                    WHERE u.station_name = s.name AND u.day >= ?),
+                   (SELECT SUM(u.saturated_minutes) FROM station_utilization_daily u
+                    WHERE u.station_name = s.name AND u.day >= ?),
+                   (SELECT COUNT(*) FROM station_saturation_periods p
+                    WHERE p.station_name = s.name AND p.ended_at >= ? AND p.queued_starts > 0)
+            FROM stations s
+            WHERE s.owner_id = ?
+        """, (first_day, first_day, first_day, owner_id))
+
+        return {
+            name: {
+                "utilization": round(avg * 100, 1) if avg is not None else None,
+                "saturated_hours": round((saturated or 0) / 60, 1),
+                "queue_windows": queue_windows
+            }
+            for name, avg, saturated, queue_windows in cur.fetchall()
+        }
+    except Exception as e:
+        logger.error(f"Error loading utilization: {e}")
+        return {}
+    finally:
+        conn.close()
@@ -1,6 +1,9 @@
 from flask import Flask, redirect, render_template, session
 from dotenv import load_dotenv
 from models.db import init_db, get_db
+from models.charging import get_user_stats
+from models.station import get_owner_summary
+from ai.map_utils import sync_station_coordinates
 from routes.admin_routes import admin_bp
 from routes.auth_routes import auth_bp 
 from routes.station_routes import station_bp
@@ -13,6 +16,7 @@ app.secret_key = "secret123"  # required for session
 
 # Initialize DB
 init_db()
+sync_station_coordinates()
 
 # Pre-create admin
 def create_admin():
@@ -43,29 +47,17 @@ def user_dashboard():
     if session.get("role") != "user":
         return redirect("/login")
 
-    # Compute user stats: total sessions, units charged, average green score
+    # User stats are maintained as sessions change, so this is one row
     conn = get_db()
     cur = conn.cursor()
-
-    # Total sessions
-    cur.execute("SELECT COUNT(*) FROM charging_sessions WHERE user_id=?", (session.get('user_id'),))
-    total_sessions = cur.fetchone()[0]
-
-    # Total units charged (sum of units from completed sessions)
-    cur.execute("SELECT COALESCE(SUM(units), 0) FROM charging_sessions WHERE user_id=? AND status='Completed'", (session.get('user_id'),))
-    total_units = cur.fetchone()[0]
-
-    # Average green score of stations the user has charged at
-    cur.execute("""
-        SELECT COALESCE(AVG(s.green_score), 0)
-        FROM charging_sessions cs
-        JOIN stations s ON cs.station_name = s.name
-        WHERE cs.user_id = ?
-    """, (session.get('user_id'),))
-    avg_green_score = cur.fetchone()[0]
-
+    stats = get_user_stats(cur, session.get('user_id'))
     conn.close()
 
+    total_sessions = stats["sessions"]
+    total_units = stats["units"]
+    # Energy-weighted green score of the user's completed sessions
+    avg_green_score = (stats["green_units"] / stats["rated_units"]) if stats["rated_units"] else 0
+
     return render_template("user_dashboard.html", total_sessions=total_sessions, total_units=total_units, avg_green_score=avg_green_score)
 
 
@@ -74,35 +66,18 @@ def owner_dashboard():
     if session.get("role") != "owner":
         return redirect("/login")
 
-    # Compute owner stats: total stations, users served, revenue
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Total stations owned
-    cur.execute("SELECT COUNT(*) FROM stations WHERE owner_id=?", (session.get('user_id'),))
-    total_stations = cur.fetchone()[0]
-
-    # Users served (distinct users with sessions at this owner's stations)
-    cur.execute("""
-        SELECT COUNT(DISTINCT cs.user_id)
-        FROM charging_sessions cs
-        JOIN stations s ON cs.station_name = s.name
-        WHERE s.owner_id = ?
-    """, (session.get('user_id'),))
-    users_served = cur.fetchone()[0]
-
-    # Revenue generated (sum of amounts for sessions at owner's stations)
-    cur.execute("""
-        SELECT COALESCE(SUM(cs.amount), 0)
-        FROM charging_sessions cs
-        JOIN stations s ON cs.station_name = s.name
-        WHERE s.owner_id = ?
-    """, (session.get('user_id'),))
-    total_revenue = cur.fetchone()[0]
-
-    conn.close()
-
-    return render_template("owner_dashboard.html", total_stations=total_stations, total_users=users_served, total_revenue=total_revenue)
+    # Cached per owner and refreshed when their stations' sessions change
+    summary = get_owner_summary(session.get('user_id'))
+
+    return render_template(
+        "owner_dashboard.html",
+        total_stations=summary["total_stations"],
+        total_users=summary["users_served"],
+        total_revenue=summary["total_revenue"],
+        active_sessions=summary["active_sessions"],
+        queue_depth=summary["queue_depth"],
+        revenue_windows=summary["revenue_windows"]
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,533 @@
+from datetime import datetime, timedelta
+from models.db import get_db
+
+# Hour bucket of a session's start, e.g. '2026-01-05 14:00:00'
+HOUR_BUCKET_SQL = "strftime('%Y-%m-%d %H:00:00', started_at)"
+HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+
+ROLLUP_COLUMNS = ("sessions", "completed", "cancelled", "units", "revenue", "duration_minutes", "timed_sessions")
+
+# Trailing windows in days, plus "mtd" for month-to-date
+DEFAULT_WINDOWS = ("7d", "14d", "30d", "90d", "mtd")
+WINDOW_KEYS = ("user_id", "station_name")
+
+USER_STATS_COLUMNS = ("sessions", "completed", "units", "spend", "rated_sessions", "rated_units", "green_score_sum", "green_units", "co2_kg")
+USER_STATION_COLUMNS = ("completed", "units", "amount", "priced_sessions", "unit_price_sum")
+
+SESSION_STATUSES = ("Active", "Completed", "Cancelled")
+
+# Estimated grid CO2 per kWh: 0.2 kg at a green score of 10, 0.6 kg at 0,
+# 0.4 kg when the station is unknown
+CO2_BASE_KG = 0.2
+CO2_PER_GREEN_POINT_KG = 0.04
+CO2_UNRATED_KG = 0.4
+
+
+# ===============================
+# SESSION ROLLUPS
+# ===============================
+def current_hour():
+    """Bucket start of the current hour; session timestamps default to SQLite's CURRENT_TIMESTAMP, which is UTC"""
+    return datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+def get_session_snapshot(cur, session_id):
+    """
+    Rollup-relevant fields of a session, taken before it is modified
+    Pass the result to apply_session_change() after the update
+    """
+    cur.execute(f"""
+        SELECT station_name, {HOUR_BUCKET_SQL}, status, units, amount, duration_minutes, user_id, started_at
+        FROM charging_sessions
+        WHERE id = ?
+    """, (session_id,))
+    return cur.fetchone()
+
+
+def _contribution(snapshot):
+    """What one session adds to its hourly rollup row"""
+    if snapshot is None:
+        return (0,) * len(ROLLUP_COLUMNS)
+
+    station_name, bucket, status, units, amount, duration = snapshot[:6]
+    billed = status != "Cancelled"
+    return (
+        1,
+        1 if status == "Completed" else 0,
+        1 if status == "Cancelled" else 0,
+        (units or 0) if billed else 0,
+        (amount or 0) if billed else 0,
+        duration or 0,
+        1 if duration is not None else 0
+    )
+
+
+def apply_session_change(cur, session_id, before=None):
+    """
+    Fold a session insert or update into session_rollup_hourly
+    before: snapshot from get_session_snapshot() taken ahead of the update,
+    None for a newly inserted session. Runs on the caller's cursor so the
+    rollup commits (or rolls back) together with the session change.
+    """
+    after = get_session_snapshot(cur, session_id)
+    if after is None:
+        return
+
+    green_score = record_session_eco(cur, session_id, after)
+    apply_user_stats_change(cur, session_id, before, after, green_score)
+    if after[1] is None:
+        return
+
+    delta = [new - old for new, old in zip(_contribution(after), _contribution(before))]
+    if not any(delta):
+        return
+
+    cur.execute(f"""
+        INSERT INTO session_rollup_hourly (station_name, hour_bucket, {", ".join(ROLLUP_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(station_name, hour_bucket) DO UPDATE SET
+            {", ".join(f"{col} = {col} + excluded.{col}" for col in ROLLUP_COLUMNS)}
+    """, (after[0], after[1], *delta))
+    bump_station_version(cur, after[0])
+
+
+# ===============================
+# ECO LEDGER
+# ===============================
+def co2_per_kwh(green_score):
+    if green_score is None:
+        return CO2_UNRATED_KG
+    return CO2_BASE_KG + (10 - green_score) * CO2_PER_GREEN_POINT_KG
+
+
+def _co2_per_kwh_sql(green_score_column):
+    return (f"CASE WHEN {green_score_column} IS NULL THEN {CO2_UNRATED_KG} "
+            f"ELSE {CO2_BASE_KG} + (10 - {green_score_column}) * {CO2_PER_GREEN_POINT_KG} END")
+
+
+def _station_green_score(cur, station_name):
+    cur.execute("SELECT green_score FROM stations WHERE name = ? ORDER BY id LIMIT 1", (station_name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def record_session_eco(cur, session_id, after):
+    """
+    Keep a session's session_eco_ledger entry in step with the session
+    The station's green score is stored when the session first completes, so
+    later green score changes do not rewrite its CO2 figure.
+    Returns: the green score the session is accounted with (None if unrated)
+    """
+    cur.execute("SELECT green_score FROM session_eco_ledger WHERE session_id = ?", (session_id,))
+    row = cur.fetchone()
+
+    station_name, status, units, user_id = after[0], after[2], after[3] or 0, after[6]
+    if status != "Completed":
+        if row:
+            cur.execute("DELETE FROM session_eco_ledger WHERE session_id = ?", (session_id,))
+        return row[0] if row else None
+
+    green_score = row[0] if row else _station_green_score(cur, station_name)
+    cur.execute("""
+        INSERT INTO session_eco_ledger (session_id, user_id, station_name, units, green_score, co2_kg)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET units = excluded.units, co2_kg = excluded.co2_kg
+    """, (session_id, user_id, station_name, units, green_score, units * co2_per_kwh(green_score)))
+    return green_score
+
+
+def backfill_eco_ledger(cur):
+    """
+    Add ledger entries for completed sessions that have none, at current green
+    scores, and drop entries of sessions that are no longer completed
+    Existing entries keep the green score they were recorded with.
+    Returns: number of entries added
+    """
+    cur.execute("""
+        DELETE FROM session_eco_ledger
+        WHERE session_id NOT IN (SELECT id FROM charging_sessions WHERE status = 'Completed')
+    """)
+    cur.execute(f"""
+        UPDATE session_eco_ledger
+        SET units = COALESCE((SELECT cs.units FROM charging_sessions cs WHERE cs.id = session_eco_ledger.session_id), 0),
+            co2_kg = COALESCE((SELECT cs.units FROM charging_sessions cs WHERE cs.id = session_eco_ledger.session_id), 0)
+                     * ({_co2_per_kwh_sql("green_score")})
+    """)
+    cur.execute(f"""
+        INSERT INTO session_eco_ledger (session_id, user_id, station_name, units, green_score, co2_kg, recorded_at)
+        SELECT cs.id, cs.user_id, cs.station_name, COALESCE(cs.units, 0), g.green_score,
+               COALESCE(cs.units, 0) * ({_co2_per_kwh_sql("g.green_score")}),
+               COALESCE(cs.completed_at, cs.started_at)
+        FROM charging_sessions cs
+        LEFT JOIN (
+            SELECT name, green_score FROM stations s
+            WHERE s.id = (SELECT MIN(id) FROM stations WHERE name = s.name)
+        ) g ON g.name = cs.station_name
+        WHERE cs.status = 'Completed'
+          AND NOT EXISTS (SELECT 1 FROM session_eco_ledger l WHERE l.session_id = cs.id)
+    """)
+    return cur.rowcount
+
+
+# ===============================
+# USER STATS
+# ===============================
+
+def _user_contribution(snapshot, green_score):
+    """What one session adds to its user_stats and user_station_stats rows"""
+    if snapshot is None:
+        return (0,) * len(USER_STATS_COLUMNS), (0,) * len(USER_STATION_COLUMNS)
+
+    status, units, amount = snapshot[2], snapshot[3] or 0, snapshot[4] or 0
+    completed = status == "Completed"
+    rated = completed and green_score is not None
+    priced = completed and units > 0
+    return (
+        (
+            1,
+            1 if completed else 0,
+            units if completed else 0,
+            amount if completed else 0,
+            1 if rated else 0,
+            units if rated else 0,
+            green_score if rated else 0,
+            units * green_score if rated else 0,
+            units * co2_per_kwh(green_score) if completed else 0
+        ),
+        (
+            1 if completed else 0,
+            units if completed else 0,
+            amount if completed else 0,
+            1 if priced else 0,
+            amount / units if priced else 0
+        )
+    )
+
+
+def apply_user_stats_change(cur, session_id, before, after, green_score):
+    """
+    Fold a session change into user_stats and user_station_stats
+    Called from apply_session_change(), so it shares the session's transaction.
+    green_score: the score the session's eco ledger entry was recorded with.
+    """
+    user_id, station_name, started_at = after[6], after[0], after[7]
+    if user_id is None:
+        return
+
+    new_user, new_station = _user_contribution(after, green_score)
+    old_user, old_station = _user_contribution(before, green_score)
+
+    user_delta = [new - old for new, old in zip(new_user, old_user)]
+    if any(user_delta):
+        cur.execute(f"""
+            INSERT INTO user_stats (user_id, {", ".join(USER_STATS_COLUMNS)})
+            VALUES ({", ".join("?" * (len(USER_STATS_COLUMNS) + 1))})
+            ON CONFLICT(user_id) DO UPDATE SET
+                {", ".join(f"{col} = {col} + excluded.{col}" for col in USER_STATS_COLUMNS)}
+        """, (user_id, *user_delta))
+
+    if before is None:
+        cur.execute("""
+            UPDATE user_stats SET last_session_id = ?, last_started_at = ?
+            WHERE user_id = ? AND (last_started_at IS NULL OR last_started_at <= ?)
+        """, (session_id, started_at, user_id, started_at))
+
+    station_delta = [new - old for new, old in zip(new_station, old_station)]
+    if station_name is not None and any(station_delta):
+        cur.execute(f"""
+            INSERT INTO user_station_stats (user_id, station_name, {", ".join(USER_STATION_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, station_name) DO UPDATE SET
+                {", ".join(f"{col} = {col} + excluded.{col}" for col in USER_STATION_COLUMNS)}
+        """, (user_id, station_name, *station_delta))
+
+
+def get_user_stats(cur, user_id):
+    """
+    A user's lifetime totals and latest session from user_stats, one row
+    Returns: dict (all zeros for a user without sessions)
+    """
+    cur.execute(f"""
+        SELECT {", ".join(f"us.{col}" for col in USER_STATS_COLUMNS)},
+               cs.started_at, cs.units, cs.amount, cs.station_name, cs.status
+        FROM user_stats us
+        LEFT JOIN charging_sessions cs ON cs.id = us.last_session_id
+        WHERE us.user_id = ?
+    """, (user_id,))
+    row = cur.fetchone()
+
+    stats = dict(zip(USER_STATS_COLUMNS, row or (0,) * len(USER_STATS_COLUMNS)))
+    stats["last_session"] = row[len(USER_STATS_COLUMNS):] if row and row[len(USER_STATS_COLUMNS)] else None
+    return stats
+
+
+def get_user_station_stats(cur, user_id):
+    """Per-station completed totals for one user: {station: {completed, units, amount, avg_unit_price}}"""
+    cur.execute(f"""
+        SELECT station_name, {", ".join(USER_STATION_COLUMNS)}
+        FROM user_station_stats
+        WHERE user_id = ? AND completed > 0
+    """, (user_id,))
+    return {
+        name: {
+            "completed": completed,
+            "units": units,
+            "amount": amount,
+            "avg_unit_price": unit_price_sum / priced if priced else None
+        }
+        for name, completed, units, amount, priced, unit_price_sum in cur.fetchall()
+    }
+
+
+def rebuild_user_stats(cur):
+    """
+    Recompute user_stats and user_station_stats from charging_sessions
+    Green scores and CO2 come from session_eco_ledger, so run
+    backfill_eco_ledger() first.
+    Returns: (user_stats rows, user_station_stats rows)
+    """
+    cur.execute("DELETE FROM user_stats")
+    cur.execute("DELETE FROM user_station_stats")
+
+    # MAX(started_at) is the only min/max aggregate, so the bare id is the latest session's
+    cur.execute(f"""
+        INSERT INTO user_stats (user_id, {", ".join(USER_STATS_COLUMNS)}, last_session_id, last_started_at)
+        SELECT user_id,
+               COUNT(*),
+               SUM(completed),
+               SUM(completed * units),
+               SUM(completed * amount),
+               SUM(rated),
+               SUM(rated * units),
+               SUM(rated * COALESCE(green_score, 0)),
+               SUM(rated * units * COALESCE(green_score, 0)),
+               SUM(completed * co2_kg),
+               id, MAX(started_at)
+        FROM (
+            SELECT cs.id, cs.user_id, cs.started_at,
+                   COALESCE(cs.units, 0) AS units, COALESCE(cs.amount, 0) AS amount,
+                   cs.status = 'Completed' AS completed,
+                   l.green_score, COALESCE(l.co2_kg, 0) AS co2_kg,
+                   (cs.status = 'Completed' AND l.green_score IS NOT NULL) AS rated
+            FROM charging_sessions cs
+            LEFT JOIN session_eco_ledger l ON l.session_id = cs.id
+            WHERE cs.user_id IS NOT NULL
+        )
+        GROUP BY user_id
+    """)
+    users = cur.rowcount
+
+    cur.execute(f"""
+        INSERT INTO user_station_stats (user_id, station_name, {", ".join(USER_STATION_COLUMNS)})
+        SELECT user_id, station_name,
+               COUNT(*),
+               SUM(COALESCE(units, 0)),
+               SUM(COALESCE(amount, 0)),
+               SUM(CASE WHEN units > 0 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN units > 0 THEN COALESCE(amount, 0) / units ELSE 0 END)
+        FROM charging_sessions
+        WHERE user_id IS NOT NULL AND station_name IS NOT NULL AND status = 'Completed'
+        GROUP BY user_id, station_name
+    """)
+    return users, cur.rowcount
+
+
+def bump_station_version(cur, station_name):
+    """Mark everything derived from a station's sessions or pricing as out of date"""
+    cur.execute("""
+        INSERT INTO station_data_versions (station_name, version) VALUES (?, 1)
+        ON CONFLICT(station_name) DO UPDATE SET version = version + 1
+    """, (station_name,))
+
+
+def get_station_version(cur, station_name):
+    cur.execute("SELECT version FROM station_data_versions WHERE station_name = ?", (station_name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+# ===============================
+# WINDOWED AGGREGATES
+# ===============================
+def window_start(window, now=None):
+    """Start of a trailing window such as '30d' or 'mtd', in UTC like session timestamps"""
+    now = now or datetime.utcnow()
+    if window == "mtd":
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return now - timedelta(days=int(window.rstrip("d")))
+
+
+def window_columns(windows, measures, ts_column="started_at", now=None):
+    """
+    SUM(CASE WHEN ...) select-list covering several trailing windows in one scan
+    measures: (name, SQL expression) pairs summed inside each window; "1" counts rows
+    Returns: (SQL fragment, params, earliest window start as a timestamp string).
+    Columns come window by window, measure by measure; see unpack_windows().
+    """
+    columns, params = [], []
+    starts = {window: window_start(window, now).strftime("%Y-%m-%d %H:%M:%S") for window in windows}
+    for window in windows:
+        for _, expression in measures:
+            columns.append(f"SUM(CASE WHEN {ts_column} >= ? THEN {expression} ELSE 0 END)")
+            params.append(starts[window])
+    return ", ".join(columns), params, min(starts.values())
+
+
+def unpack_windows(values, windows, measures):
+    """Split a row's window columns back into {window: {measure: value}}"""
+    values = iter(values)
+    return {window: {name: next(values) or 0 for name, _ in measures} for window in windows}
+
+
+def windowed_totals(cur, key_column, keys, windows=DEFAULT_WINDOWS, group_by=None, now=None):
+    """
+    Completed-session spend/revenue and counts over several trailing windows
+    key_column: 'user_id' or 'station_name'; keys: one value or a list.
+    Totals are grouped by key_column unless group_by names another one.
+    Only sessions inside the widest window are read, through the
+    (key, status, started_at) indexes.
+    Returns: {group: {window: {"total": amount, "sessions": count}}}
+    """
+    if key_column not in WINDOW_KEYS or (group_by or key_column) not in WINDOW_KEYS:
+        raise ValueError(f"Unsupported window key: {key_column}")
+    keys = list(keys) if isinstance(keys, (list, tuple, set)) else [keys]
+    if not keys:
+        return {}
+
+    group_by = group_by or key_column
+    measures = (("total", "amount"), ("sessions", "1"))
+    columns, params, earliest = window_columns(windows, measures, now=now)
+    cur.execute(f"""
+        SELECT {group_by}, {columns}
+        FROM charging_sessions
+        WHERE {key_column} IN ({", ".join("?" for _ in keys)})
+          AND status = 'Completed' AND started_at >= ?
+        GROUP BY {group_by}
+    """, (*params, *keys, earliest))
+
+    return {row[0]: unpack_windows(row[1:], windows, measures) for row in cur.fetchall()}
+
+
+def combine_windows(totals, windows=DEFAULT_WINDOWS):
+    """Add up windowed_totals() groups, e.g. every station of an owner"""
+    return {
+        window: {
+            "total": round(sum(group[window]["total"] for group in totals.values()), 2),
+            "sessions": sum(group[window]["sessions"] for group in totals.values())
+        }
+        for window in windows
+    }
+
+
+# ===============================
+# SESSION LISTING
+# ===============================
+def parse_day(value):
+    """'YYYY-MM-DD' from a query string as a date, None if blank or malformed"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        return None
+
+
+def session_filters(station=None, status=None, start=None, end=None, station_names=None, column_prefix=""):
+    """
+    WHERE clause and params for listing charging_sessions
+    start/end: dates, both inclusive. station_names restricts to a set of
+    stations (an owner's), on top of any single station filter.
+    """
+    clauses, params = [], []
+    if station:
+        clauses.append(f"{column_prefix}station_name = ?")
+        params.append(station)
+    if station_names is not None:
+        clauses.append(f"{column_prefix}station_name IN ({', '.join('?' for _ in station_names) or 'NULL'})")
+        params.extend(station_names)
+    if status in SESSION_STATUSES:
+        clauses.append(f"{column_prefix}status = ?")
+        params.append(status)
+    if start:
+        clauses.append(f"{column_prefix}started_at >= ?")
+        params.append(start.strftime("%Y-%m-%d 00:00:00"))
+    if end:
+        clauses.append(f"{column_prefix}started_at < ?")
+        params.append((end + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00"))
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+def rollup_filters(station=None, start=None, end=None, station_names=None):
+    """session_filters() for session_rollup_hourly, with the date range applied to hour buckets"""
+    where, params = session_filters(station, None, None, None, station_names)
+    if start:
+        where += " AND hour_bucket >= ?"
+        params.append(start.strftime(HOUR_FORMAT))
+    if end:
+        where += " AND hour_bucket < ?"
+        params.append((end + timedelta(days=1)).strftime(HOUR_FORMAT))
+    return where, params
+
+
+def rollup_totals(cur, station=None, status=None, start=None, end=None, station_names=None):
+    """
+    Session count and billed revenue/units matching listing filters, from session_rollup_hourly
+    The rollup does not split revenue and units by status, so with a status
+    filter they are None rather than totals for sessions the filter excludes.
+    """
+    where, params = rollup_filters(station, start, end, station_names)
+    cur.execute(f"""
+        SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(completed), 0), COALESCE(SUM(cancelled), 0),
+               COALESCE(SUM(revenue), 0), COALESCE(SUM(units), 0)
+        FROM session_rollup_hourly
+        WHERE {where}
+    """, params)
+    sessions, completed, cancelled, revenue, units = cur.fetchone()
+    matching = {"Completed": completed, "Cancelled": cancelled, "Active": sessions - completed - cancelled}
+    return {
+        "sessions": matching.get(status, sessions),
+        "revenue": None if status else round(revenue, 2),
+        "units": None if status else round(units, 2)
+    }
+
+
+def rebuild_session_rollup(cur):
+    """
+    Recompute session_rollup_hourly from charging_sessions
+    Returns: number of rollup rows written
+    """
+    cur.execute("DELETE FROM session_rollup_hourly")
+    # Every cached view was built from the old rows
+    cur.execute("UPDATE station_data_versions SET version = version + 1")
+    cur.execute(f"""
+        INSERT INTO session_rollup_hourly (station_name, hour_bucket, {", ".join(ROLLUP_COLUMNS)})
+        SELECT station_name, {HOUR_BUCKET_SQL} AS bucket,
+               COUNT(*),
+               SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'Cancelled' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status != 'Cancelled' THEN COALESCE(units, 0) ELSE 0 END),
+               SUM(CASE WHEN status != 'Cancelled' THEN COALESCE(amount, 0) ELSE 0 END),
+               COALESCE(SUM(duration_minutes), 0),
+               COUNT(duration_minutes)
+        FROM charging_sessions
+        WHERE station_name IS NOT NULL AND {HOUR_BUCKET_SQL} IS NOT NULL
+        GROUP BY station_name, bucket
+    """)
+    return cur.rowcount
+
+
+def rebuild_rollups():
+    """Backfill every rollup table in one transaction"""
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        rows = rebuild_session_rollup(cur)
+        eco_entries = backfill_eco_ledger(cur)
+        users, user_stations = rebuild_user_stats(cur)
+        conn.commit()
+        return {"session_rollup_hourly": rows, "session_eco_ledger": eco_entries,
+                "user_stats": users, "user_station_stats": user_stations}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
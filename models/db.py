@@ -12,6 +12,10 @@ def init_db():
     conn = get_db()
     cur = conn.cursor()
 
+    # Write-ahead logging lets long reads (exports, nightly batch, streamed pages)
+    # run alongside writes; the setting is stored in the database file
+    cur.execute("PRAGMA journal_mode=WAL")
+
     # ===============================
     # ADMIN TABLE
     # ===============================
@@ -82,6 +86,18 @@ CREATE TABLE IF NOT EXISTS stations (
     )
     """)
 
+    # ===============================
+    # NL SEARCH FILTER CACHE
+    # ===============================
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS nl_query_cache (
+        query_key TEXT PRIMARY KEY,
+        filters TEXT,
+        created_at REAL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_nl_query_cache_created ON nl_query_cache(created_at)")
+
     conn.commit()
     # Insert some sample users for testing (non-destructive)
     try:
@@ -111,3 +127,363 @@ CREATE TABLE IF NOT EXISTS stations (
             conn.close()
         except Exception:
             pass
+
+    # Ensure station coordinate columns exist for older DBs (used by NL distance search)
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("PRAGMA table_info(stations)")
+        cols = [c[1] for c in cur.fetchall()]
+        if 'latitude' not in cols:
+            cur.execute("ALTER TABLE stations ADD COLUMN latitude REAL")
+        if 'longitude' not in cols:
+            cur.execute("ALTER TABLE stations ADD COLUMN longitude REAL")
+
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_stations_approved_lat_lng ON stations(approved, latitude, longitude)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_station_status ON charging_sessions(station_name, status)")
+        # Windowed spend/revenue totals (models.charging.windowed_totals) seek on key + status + time
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_window ON charging_sessions(user_id, status, started_at, amount)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_station_window ON charging_sessions(station_name, status, started_at, amount)")
+        # Distinct users served per station without touching the table
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_station_user ON charging_sessions(station_name, user_id)")
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # STATION FULL-TEXT INDEX (FTS5)
+    # ===============================
+    # External-content table over stations.name/location, kept in sync by triggers.
+    # Skipped silently when the SQLite build has no FTS5.
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='stations_fts'")
+        fts_exists = cur.fetchone() is not None
+
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS stations_fts USING fts5(
+            name,
+            location,
+            content='stations',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """)
+
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_insert AFTER INSERT ON stations BEGIN
+            INSERT INTO stations_fts(rowid, name, location) VALUES (new.id, new.name, new.location);
+        END
+        """)
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_delete AFTER DELETE ON stations BEGIN
+            INSERT INTO stations_fts(stations_fts, rowid, name, location) VALUES ('delete', old.id, old.name, old.location);
+        END
+        """)
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_update AFTER UPDATE OF name, location ON stations BEGIN
+            INSERT INTO stations_fts(stations_fts, rowid, name, location) VALUES ('delete', old.id, old.name, old.location);
+            INSERT INTO stations_fts(rowid, name, location) VALUES (new.id, new.name, new.location);
+        END
+        """)
+
+        # Index stations that existed before the FTS table was created
+        if not fts_exists:
+            cur.execute("INSERT INTO stations_fts(stations_fts) VALUES ('rebuild')")
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # HOURLY SESSION ROLLUP
+    # ===============================
+    # Per station and start hour; kept current by models.charging.apply_session_change
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='session_rollup_hourly'")
+        rollup_exists = cur.fetchone() is not None
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS session_rollup_hourly (
+            station_name TEXT NOT NULL,
+            hour_bucket TEXT NOT NULL,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            units REAL NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            duration_minutes INTEGER NOT NULL DEFAULT 0,
+            timed_sessions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (station_name, hour_bucket)
+        ) WITHOUT ROWID
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_session_rollup_hour ON session_rollup_hourly(hour_bucket)")
+        # Bumped with every rollup change; caches compare it to decide freshness
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS station_data_versions (
+            station_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """)
+
+        # Backfill from existing sessions the first time
+        if not rollup_exists:
+            from models.charging import rebuild_session_rollup
+            rebuild_session_rollup(cur)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # SESSION ECO LEDGER
+    # ===============================
+    # CO2 estimate per completed session at the green score it completed with;
+    # kept current by models.charging.apply_session_change
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='session_eco_ledger'")
+        ledger_exists = cur.fetchone() is not None
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS session_eco_ledger (
+            session_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            station_name TEXT,
+            units REAL NOT NULL DEFAULT 0,
+            green_score REAL,
+            co2_kg REAL NOT NULL DEFAULT 0,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_eco_ledger_user ON session_eco_ledger(user_id, units, co2_kg)")
+
+        # Backfill at today's green scores the first time
+        if not ledger_exists:
+            from models.charging import backfill_eco_ledger
+            backfill_eco_ledger(cur)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # PER-USER STATS
+    # ===============================
+    # Lifetime totals per user and per (user, station); kept current by
+    # models.charging.apply_session_change
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_stats'")
+        user_stats_exists = cur.fetchone() is not None
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            units REAL NOT NULL DEFAULT 0,
+            spend REAL NOT NULL DEFAULT 0,
+            rated_sessions INTEGER NOT NULL DEFAULT 0,
+            rated_units REAL NOT NULL DEFAULT 0,
+            green_score_sum REAL NOT NULL DEFAULT 0,
+            green_units REAL NOT NULL DEFAULT 0,
+            co2_kg REAL NOT NULL DEFAULT 0,
+            last_session_id INTEGER,
+            last_started_at TIMESTAMP
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_station_stats (
+            user_id INTEGER NOT NULL,
+            station_name TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            units REAL NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            priced_sessions INTEGER NOT NULL DEFAULT 0,
+            unit_price_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, station_name)
+        ) WITHOUT ROWID
+        """)
+
+        # Older tables predate the eco ledger totals
+        cur.execute("PRAGMA table_info(user_stats)")
+        needs_co2 = 'co2_kg' not in [c[1] for c in cur.fetchall()]
+        if needs_co2:
+            cur.execute("ALTER TABLE user_stats ADD COLUMN co2_kg REAL NOT NULL DEFAULT 0")
+
+        # Backfill from existing sessions the first time
+        if not user_stats_exists or needs_co2:
+            from models.charging import rebuild_user_stats
+            rebuild_user_stats(cur)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # METRIC SKETCHES
+    # ===============================
+    # KLL quantile sketches of per-user metrics (ai/sketches.py), rebuilt nightly
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS metric_sketches (
+            metric TEXT PRIMARY KEY,
+            sketch TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        )
+        """)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # STATION DEMAND FORECASTS
+    # ===============================
+    # Hourly forecasts written by the batch job in ai/forecasting.py
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS station_forecasts (
+            station_name TEXT NOT NULL,
+            hour_bucket TEXT NOT NULL,
+            expected REAL NOT NULL,
+            lower REAL NOT NULL,
+            upper REAL NOT NULL,
+            model TEXT,
+            generated_at TEXT,
+            PRIMARY KEY (station_name, hour_bucket)
+        ) WITHOUT ROWID
+        """)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # STATION PRICE HISTORY
+    # ===============================
+    # One row per price change (models.station.record_price)
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='station_price_history'")
+        history_exists = cur.fetchone() is not None
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS station_price_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            changed_by INTEGER
+        )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_price_history_station_time
+            ON station_price_history(station_name, changed_at)
+        """)
+
+        # Seed the current price, effective from the station's first session
+        if not history_exists:
+            cur.execute("""
+                INSERT INTO station_price_history (station_name, price, changed_at, changed_by)
+                SELECT s.name, s.price,
+                       COALESCE((SELECT strftime('%Y-%m-%d %H:%M:%S', MIN(cs.started_at))
+                                 FROM charging_sessions cs WHERE cs.station_name = s.name),
+                                CURRENT_TIMESTAMP),
+                       s.owner_id
+                FROM stations s
+                WHERE s.price IS NOT NULL
+            """)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # ===============================
+    # CHARGER UTILIZATION ROLLUPS
+    # ===============================
+    # Written by the sweep-line batch in ai/utilization.py
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS station_utilization_daily (
+            station_name TEXT NOT NULL,
+            day TEXT NOT NULL,
+            chargers INTEGER NOT NULL,
+            level_minutes TEXT NOT NULL,
+            busy_charger_minutes REAL NOT NULL,
+            saturated_minutes REAL NOT NULL,
+            utilization REAL NOT NULL,
+            PRIMARY KEY (station_name, day)
+        ) WITHOUT ROWID
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS station_saturation_periods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station_name TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            ended_at TEXT NOT NULL,
+            minutes REAL NOT NULL,
+            peak_busy INTEGER NOT NULL,
+            queued_starts INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_saturation_station_end
+            ON station_saturation_periods(station_name, ended_at)
+        """)
+        conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from models.db import get_db
+from models.charging import HOUR_FORMAT, SESSION_STATUSES, parse_day, rollup_filters, session_filters
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_FETCH_SIZE = 5000
+# Days of hourly rollup aggregated per revenue export page
+REVENUE_EXPORT_DAYS = 31
+
+SESSION_EXPORT_COLUMNS = (
+    "id", "user_id", "station_name", "units", "amount", "tx_hash",
+    "status", "started_at", "completed_at", "duration_minutes"
+)
+REVENUE_EXPORT_COLUMNS = ("day", "station_name", "sessions", "completed", "cancelled", "units", "revenue")
+EXPORT_KINDS = ("sessions", "revenue")
+
+
+def sessions_export_query(station=None, status=None, start=None, end=None, station_names=None, after_id=0):
+    """(SQL, params) for the next EXPORT_FETCH_SIZE charging_sessions matching the filters, in id order"""
+    where, params = session_filters(station, status, start, end, station_names)
+    return f"""
+        SELECT {", ".join(SESSION_EXPORT_COLUMNS)}
+        FROM charging_sessions
+        WHERE {where} AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, params + [after_id, EXPORT_FETCH_SIZE]
+
+
+def revenue_export_query(station=None, start=None, end=None, station_names=None, from_hour=None, to_hour=None):
+    """(SQL, params) for daily per-station totals from session_rollup_hourly, limited to [from_hour, to_hour)"""
+    where, params = rollup_filters(station, start, end, station_names)
+    if from_hour:
+        where += " AND hour_bucket >= ?"
+        params.append(from_hour)
+    if to_hour:
+        where += " AND hour_bucket < ?"
+        params.append(to_hour)
+    return f"""
+        SELECT substr(hour_bucket, 1, 10) AS day, station_name,
+               SUM(sessions), SUM(completed), SUM(cancelled), ROUND(SUM(units), 3), ROUND(SUM(revenue), 2)
+        FROM session_rollup_hourly
+        WHERE {where}
+        GROUP BY day, station_name
+        ORDER BY day, station_name
+    """, params
+
+
+def _session_pages(filters):
+    """Page reader for stream_export(): keyset on session id"""
+    def fetch(cur, after):
+        cur.execute(*sessions_export_query(**filters, after_id=after or 0))
+        rows = cur.fetchall()
+        return rows, rows[-1][0] if rows else None
+
+    return fetch
+
+
+def _revenue_pages(filters):
+    """Page reader for stream_export(): REVENUE_EXPORT_DAYS of buckets from the next day with data"""
+    def fetch(cur, after):
+        where, params = rollup_filters(**filters)
+        cur.execute(f"""
+            SELECT MIN(hour_bucket) FROM session_rollup_hourly WHERE {where} AND hour_bucket >= ?
+        """, params + [after or ""])
+        first = cur.fetchone()[0]
+        if first is None:
+            return [], None
+
+        from_hour = first[:10] + " 00:00:00"
+        to_hour = (datetime.strptime(first[:10], "%Y-%m-%d") + timedelta(days=REVENUE_EXPORT_DAYS)).strftime(HOUR_FORMAT)
+        cur.execute(*revenue_export_query(**filters, from_hour=from_hour, to_hour=to_hour))
+        return cur.fetchall(), to_hour
+
+    return fetch
+
+
+def _encode_csv(columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(rows):
+        writer.writerows(rows)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    return encode([columns]), encode
+
+
+def _encode_ndjson(columns):
+    def encode(rows):
+        return "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
+
+    return "", encode
+
+
+def stream_export(fetch_page, columns, fmt="csv", compress=False):
+    """
+    Generator of encoded export chunks
+    fetch_page(cur, after) returns (rows, after) for the page following
+    after (None first); an empty page ends the export. Each page is read on
+    a fresh connection, so no read transaction stays open while the client
+    downloads and writers are never held up by a slow export. Rows committed
+    mid-export past the current page are included. compress gzips the stream
+    with one running zlib compressor.
+    """
+    header, encode = _encode_csv(columns) if fmt == "csv" else _encode_ndjson(columns)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(text):
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    try:
+        chunk = emit(header)
+        if chunk:
+            yield chunk
+
+        after = None
+        while True:
+            conn = get_db()
+            try:
+                rows, after = fetch_page(conn.cursor(), after)
+            finally:
+                conn.close()
+            if not rows:
+                break
+            chunk = emit(encode(rows))
+            if chunk:
+                yield chunk
+
+        chunk = compressor.flush() if compressor else b""
+        if chunk:
+            yield chunk
+    except Exception as e:
+        # Headers are already sent; the truncated download is the only signal left
+        logger.error(f"Error streaming export: {e}")
+        raise
+
+
+def export_filename(kind, fmt, compress, start=None, end=None):
+    span = f"_{start.isoformat() if start else 'start'}_to_{end.isoformat() if end else 'now'}" if start or end else ""
+    return f"{kind}{span}.{fmt}{'.gz' if compress else ''}"
+
+
+def build_export(kind, args, station_names=None):
+    """
+    Export of charging sessions or daily revenue from query-string args
+    args: mapping with optional format (csv|ndjson), gzip, station, status,
+    start and end (YYYY-MM-DD). station_names limits rows to those stations.
+    Returns: (chunk generator, mimetype, filename), or None for a bad kind/format
+    """
+    fmt = args.get("format", "csv")
+    if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+        return None
+
+    compress = args.get("gzip") in ("1", "true", "yes")
+    station = (args.get("station") or "").strip() or None
+    status = args.get("status") if args.get("status") in SESSION_STATUSES else None
+    start, end = parse_day(args.get("start")), parse_day(args.get("end"))
+
+    if kind == "sessions":
+        fetch_page = _session_pages(dict(station=station, status=status, start=start, end=end, station_names=station_names))
+        columns = SESSION_EXPORT_COLUMNS
+    else:
+        fetch_page = _revenue_pages(dict(station=station, start=start, end=end, station_names=station_names))
+        columns = REVENUE_EXPORT_COLUMNS
+
+    return (
+        stream_export(fetch_page, columns, fmt, compress),
+        "application/gzip" if compress else EXPORT_FORMATS[fmt],
+        export_filename(kind, fmt, compress, start, end)
+    )
@@ -0,0 +1,141 @@
+import logging
+from models.db import get_db
+from models.charging import bump_station_version, unpack_windows, window_columns
+from ai.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Queue joins do not bump station versions, so queue depth can lag this long
+OWNER_SUMMARY_TTL = 30
+_owner_summary_cache = LRUCache(max_entries=1000, ttl_seconds=OWNER_SUMMARY_TTL)
+OWNER_REVENUE_WINDOWS = ("7d", "30d", "mtd")
+
+
+# ===============================
+# STATION PRICING
+# ===============================
+def record_price(cur, station_name, price, changed_by=None):
+    """Append a price to station_price_history on the caller's transaction"""
+    cur.execute("""
+        INSERT INTO station_price_history (station_name, price, changed_by)
+        VALUES (?, ?, ?)
+    """, (station_name, price, changed_by))
+
+
+def update_station_price(station_id, owner_id, new_price):
+    """
+    Change an owner's station price and record it in one transaction
+    Returns: (result dict, HTTP status)
+    """
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT name, price, owner_id FROM stations WHERE id = ?", (station_id,))
+        row = cur.fetchone()
+        if not row:
+            return {"error": "Station not found"}, 404
+
+        name, old_price, station_owner = row
+        if station_owner != owner_id:
+            return {"error": "Unauthorized"}, 403
+        if old_price == new_price:
+            return {"status": "success", "message": "Price unchanged", "price": new_price}, 200
+
+        cur.execute("UPDATE stations SET price = ? WHERE id = ?", (new_price, station_id))
+        record_price(cur, name, new_price, owner_id)
+        bump_station_version(cur, name)
+        conn.commit()
+
+        return {"status": "success", "message": "Price updated", "price": new_price, "previous_price": old_price}, 200
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error updating station price: {e}")
+        return {"error": "Could not update price"}, 500
+    finally:
+        conn.close()
+
+
+# ===============================
+# OWNER SUMMARY
+# ===============================
+def _owner_data_version(cur, owner_id):
+    """Sum of the owner's station versions; any session change at their stations moves it"""
+    cur.execute("""
+        SELECT COALESCE(SUM(v.version), 0)
+        FROM stations s
+        JOIN station_data_versions v ON v.station_name = s.name
+        WHERE s.owner_id = ?
+    """, (owner_id,))
+    return cur.fetchone()[0]
+
+
+def _compute_owner_summary(cur, owner_id):
+    measures = (("total", "amount"), ("sessions", "1"))
+    windows_sql, window_params, earliest = window_columns(OWNER_REVENUE_WINDOWS, measures)
+    cur.execute(f"""
+        WITH owned AS (SELECT DISTINCT name FROM stations WHERE owner_id = ?),
+        recent AS (
+            SELECT {windows_sql}
+            FROM charging_sessions
+            WHERE station_name IN owned AND status = 'Completed' AND started_at >= ?
+        )
+        SELECT (SELECT COUNT(*) FROM stations WHERE owner_id = ?),
+               (SELECT COUNT(DISTINCT cs.user_id) FROM charging_sessions cs
+                WHERE cs.station_name IN owned),
+               (SELECT COALESCE(SUM(r.revenue), 0) FROM session_rollup_hourly r
+                WHERE r.station_name IN owned),
+               (SELECT COUNT(*) FROM charging_sessions cs
+                WHERE cs.station_name IN owned AND cs.status = 'Active'),
+               (SELECT COUNT(*) FROM waiting_queue w
+                WHERE w.station_name IN owned),
+               recent.*
+        FROM recent
+    """, (owner_id, *window_params, earliest, owner_id))
+    row = cur.fetchone()
+    stations, users, revenue, active, queued = row[:5]
+
+    revenue_windows = unpack_windows(row[5:], OWNER_REVENUE_WINDOWS, measures)
+    for window in revenue_windows.values():
+        window["total"] = round(window["total"], 2)
+
+    return {
+        "total_stations": stations,
+        "users_served": users,
+        "total_revenue": round(revenue, 2),
+        "active_sessions": active,
+        "queue_depth": queued,
+        "revenue_windows": revenue_windows
+    }
+
+
+def get_owner_summary(owner_id):
+    """
+    Stations, users served, revenue (total and recent windows), active sessions
+    and queue depth for an owner, computed in one query
+    Cached per owner until a session at one of their stations changes (their
+    station versions move) or OWNER_SUMMARY_TTL passes.
+    Returns: dict (zeros if it cannot be computed)
+    """
+    conn = get_db()
+    cur = conn.cursor()
+
+    try:
+        version = _owner_data_version(cur, owner_id)
+        cached = _owner_summary_cache.get(owner_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        summary = _compute_owner_summary(cur, owner_id)
+        _owner_summary_cache.set(owner_id, (version, summary))
+        return summary
+    except Exception as e:
+        logger.error(f"Error loading owner summary: {e}")
+        return {"total_stations": 0, "users_served": 0, "total_revenue": 0, "active_sessions": 0, "queue_depth": 0,
+                "revenue_windows": {window: {"total": 0, "sessions": 0} for window in OWNER_REVENUE_WINDOWS}}
+    finally:
+        conn.close()
+
+
+def get_owner_summary_cache_stats():
+    return _owner_summary_cache.stats()
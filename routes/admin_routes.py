@@ -1,8 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, session
+import logging
+from flask import Blueprint, Response, render_template, request, redirect, session, stream_template, stream_with_context
 from models.db import get_db
+from models.charging import SESSION_STATUSES, parse_day, rollup_totals, session_filters
+from models.export import build_export
+from ai.fuzzy_search import refresh_station
+from ai.map_utils import sync_station_coordinates
+
+logger = logging.getLogger(__name__)
 
 admin_bp = Blueprint("admin", __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Query-string filters the dashboard carries over to its paging and export links
+FILTER_ARGS = ("station", "status", "start", "end")
+
 # Admin Login
 @admin_bp.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
@@ -34,60 +46,97 @@ def admin_dashboard():
     if not session.get("admin_logged_in"):
         return redirect("/admin/login")
 
+    # Filters and keyset cursor from the query string
+    filters = {
+        "station": request.args.get("station", "").strip() or None,
+        "status": request.args.get("status") if request.args.get("status") in SESSION_STATUSES else None,
+        "start": parse_day(request.args.get("start")),
+        "end": parse_day(request.args.get("end"))
+    }
+    before = request.args.get("before", type=int)
+    page_size = min(max(request.args.get("page_size", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
     # Initialize all variables
     total_users = 0
     total_stations = 0
-    total_sessions = 0
-    total_revenue = 0
+    platform = {"sessions": 0, "revenue": 0, "units": 0}
+    matching = platform
     sessions = []
+    next_cursor = None
 
+    conn = get_db()
+    cur = conn.cursor()
     try:
-        conn = get_db()
-        cur = conn.cursor()
-
         cur.execute("SELECT COUNT(*) FROM users")
-        result = cur.fetchone()
-        total_users = result[0] if result else 0
+        total_users = cur.fetchone()[0]
 
         cur.execute("SELECT COUNT(*) FROM stations")
-        result = cur.fetchone()
-        total_stations = result[0] if result else 0
-
-        cur.execute("SELECT COUNT(*) FROM charging_sessions")
-        result = cur.fetchone()
-        total_sessions = result[0] if result else 0
-
-        cur.execute("SELECT IFNULL(SUM(amount), 0) FROM charging_sessions")
-        result = cur.fetchone()
-        total_revenue = result[0] if result else 0
-
-        print("TOTAL USERS:", total_users)
-        print("TOTAL STATIONS:", total_stations)
-        print("TOTAL SESSIONS:", total_sessions)
-        print("TOTAL REVENUE:", total_revenue)
-
-        cur.execute("""
-            SELECT station_name, units, amount, tx_hash, status
+        total_stations = cur.fetchone()[0]
+
+        # Session totals come from the hourly rollup, not a scan of every session
+        platform = rollup_totals(cur)
+        matching = rollup_totals(cur, **filters) if any(filters.values()) else platform
+
+        where, params = session_filters(**filters)
+        if before:
+            where += " AND id < ?"
+            params.append(before)
+        cur.execute(f"""
+            SELECT id, station_name, units, amount, tx_hash, status, started_at
             FROM charging_sessions
-        """)
-        sessions = cur.fetchall() or []
+            WHERE {where}
+            ORDER BY id DESC
+            LIMIT ?
+        """, (*params, page_size + 1))
+        # A bounded page, read before rendering so no read stays open while the response streams
+        sessions = cur.fetchall()
+        if len(sessions) > page_size:
+            # The extra row only says another page exists
+            sessions = sessions[:page_size]
+            next_cursor = sessions[-1][0]
+    except Exception as e:
+        logger.error(f"Error loading admin dashboard: {e}")
+    finally:
         conn.close()
 
-    except Exception as e:
-        print(f"Error loading admin dashboard: {e}")
-        import traceback
-        traceback.print_exc()
+    filter_args = {key: request.args[key] for key in FILTER_ARGS if request.args.get(key)}
 
-    return render_template(
+    return stream_template(
         "admin_dashboard.html",
         total_users=total_users,
         total_stations=total_stations,
-        total_sessions=total_sessions,
-        total_revenue=total_revenue,
-        sessions=sessions
+        total_sessions=platform["sessions"],
+        total_revenue=platform["revenue"],
+        matching=matching,
+        filters=filters,
+        filtered=any(filters.values()),
+        # Filter arguments carried over to the paging and export links
+        query=dict(filter_args, **({"page_size": page_size} if "page_size" in request.args else {})),
+        export_query=filter_args,
+        statuses=SESSION_STATUSES,
+        first_page=before is None,
+        sessions=sessions,
+        next_cursor=next_cursor
     )
 
 
+# Admin Export
+@admin_bp.route("/admin/export/<kind>")
+def admin_export(kind):
+    if not session.get("admin_logged_in"):
+        return {"error": "Unauthorized"}, 403
+
+    export = build_export(kind, request.args)
+    if export is None:
+        return {"error": "Unknown export; use /admin/export/sessions or /admin/export/revenue with format=csv|ndjson"}, 400
+
+    chunks, mimetype, filename = export
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"}
+    )
+
 
 # Admin Logout
 @admin_bp.route("/admin/logout")
@@ -190,9 +239,16 @@ def approve_station(station_id):
     cur.execute("""
         UPDATE stations SET approved=1 WHERE id=?
     """, (station_id,))
+    cur.execute("SELECT name FROM stations WHERE id=?", (station_id,))
+    row = cur.fetchone()
     conn.commit()
     conn.close()
 
+    # Owners may skip coordinates; fill known ones so the station shows up in distance search
+    if row:
+        sync_station_coordinates(row[0])
+    refresh_station(station_id)
+
     return redirect("/admin/stations")
 
 @admin_bp.route("/admin/queue")
@@ -216,3 +272,23 @@ def admin_queue():
 
 
 
+
+
+@admin_bp.route("/admin/cache-stats")
+def admin_cache_stats():
+    if not session.get("admin_logged_in"):
+        return {"error": "Unauthorized"}, 403
+
+    from ai.analytics import get_analytics_cache_stats
+    from ai.nl_query import get_query_cache_stats
+    from ai.response_cache import response_cache
+    from ai.singleflight import ai_requests
+    from models.station import get_owner_summary_cache_stats
+
+    return {
+        "nl_query": get_query_cache_stats(),
+        "chat_responses": response_cache.stats(),
+        "station_analytics": get_analytics_cache_stats(),
+        "owner_summaries": get_owner_summary_cache_stats(),
+        "in_flight_coalescing": ai_requests.stats()
+    }
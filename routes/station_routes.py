@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, session
+import json
+import math
+from flask import Blueprint, Response, render_template, request, redirect, session, stream_with_context
 from models.db import get_db
+from models.charging import apply_session_change, get_session_snapshot, windowed_totals
+from models.station import record_price, update_station_price
+from models.export import build_export
 from ai.recommender import recommend_station
 from blockchain.payment import process_payment
+from ai.fuzzy_search import refresh_station
+from ai.map_utils import add_station_coordinates
 
 station_bp = Blueprint("station", __name__)
 
@@ -27,14 +34,34 @@ def add_station():
             INSERT INTO stations (name, location, chargers, price, green_score, owner_id, approved)
             VALUES (?, ?, ?, ?, ?, ?, 0)
         """, (name, location, chargers, price, green_score, owner_id))
+        station_id = cur.lastrowid
+        record_price(cur, name, price, owner_id)
         conn.commit()
         conn.close()
 
+        # Distance search can only place stations that have coordinates
+        coords = _form_coordinates(request.form)
+        if coords:
+            add_station_coordinates(name, *coords)
+
+        refresh_station(station_id)
+
         return redirect("/owner/stations")
 
     return render_template("owner_add_station.html")
 
 
+def _form_coordinates(form):
+    """(lat, lng) from optional latitude/longitude fields, or None if missing, non-finite or out of range"""
+    try:
+        lat, lng = float(form.get("latitude", "")), float(form.get("longitude", ""))
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None
+
+
 # ===============================
 # OWNER: VIEW OWN STATIONS
 # ===============================
@@ -46,14 +73,38 @@ def owner_stations():
     conn = get_db()
     cur = conn.cursor()
     cur.execute("""
-        SELECT name, location, chargers, price, green_score
+        SELECT name, location, chargers, price, green_score, id
         FROM stations
         WHERE owner_id=?
     """, (session.get("user_id"),))
     stations = cur.fetchall()
+    revenue = windowed_totals(cur, "station_name", [s[0] for s in stations], windows=("7d", "30d", "mtd"))
     conn.close()
 
-    return render_template("owner_stations.html", stations=stations)
+    from ai.utilization import get_owner_utilization
+    utilization = get_owner_utilization(session.get("user_id"))
+
+    return render_template("owner_stations.html", stations=stations, utilization=utilization, revenue=revenue)
+
+
+# ===============================
+# OWNER: UPDATE STATION PRICE
+# ===============================
+@station_bp.route("/owner/update-price/<int:station_id>", methods=["POST"])
+def owner_update_price(station_id):
+    if session.get("role") != "owner":
+        return {"error": "Unauthorized"}, 403
+
+    try:
+        price = round(float(request.form.get("price", "")), 2)
+    except ValueError:
+        return {"error": "Price must be a number"}, 400
+    if not math.isfinite(price):
+        return {"error": "Price must be a finite number"}, 400
+    if price <= 0:
+        return {"error": "Price must be greater than zero"}, 400
+
+    return update_station_price(station_id, session.get("user_id"), price)
 
 
 # ===============================
@@ -206,6 +257,7 @@ def charge_station(station_name):
             payment["tx_hash"],
             "Active"
         ))
+        apply_session_change(cur, cur.lastrowid)
 
         conn.commit()
         conn.close()
@@ -238,12 +290,14 @@ def complete_charging(session_id):
         return redirect("/user/history")
 
     station_name = row[0]
+    before = get_session_snapshot(cur, session_id)
 
     # Mark session completed
     cur.execute(
         "UPDATE charging_sessions SET status='Completed' WHERE id=?",
         (session_id,)
     )
+    apply_session_change(cur, session_id, before)
 
     # Remove first user from queue (FIFO)
     cur.execute("""
@@ -418,11 +472,13 @@ def stop_charging(session_id):
         price = r[0] if r else 0
         amount_to_set = units * price if units else 0
 
+    before = get_session_snapshot(cur, session_id)
     cur.execute("""
         UPDATE charging_sessions 
         SET status='Completed', completed_at=?, duration_minutes=?, amount=?
         WHERE id=?
     """, (now, duration_minutes, amount_to_set, session_id))
+    apply_session_change(cur, session_id, before)
 
     # Remove first user from queue (for next user)
     cur.execute("""
@@ -484,6 +540,32 @@ def owner_active_sessions():
     return render_template("owner_active_sessions.html", sessions=sessions)
 
 
+# ===============================
+# OWNER: EXPORT SESSIONS / REVENUE
+# ===============================
+@station_bp.route("/owner/export/<kind>")
+def owner_export(kind):
+    if session.get("role") != "owner":
+        return {"error": "Unauthorized"}, 403
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM stations WHERE owner_id=?", (session.get("user_id"),))
+    station_names = [row[0] for row in cur.fetchall()]
+    conn.close()
+
+    export = build_export(kind, request.args, station_names)
+    if export is None:
+        return {"error": "Unknown export; use /owner/export/sessions or /owner/export/revenue with format=csv|ndjson"}, 400
+
+    chunks, mimetype, filename = export
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"}
+    )
+
+
 # ===============================
 # OWNER: COMPLETE USER'S CHARGING
 # ===============================
@@ -549,11 +631,13 @@ def owner_complete_charging(session_id):
         price = r[0] if r else 0
         amount_to_set = units * price if units else 0
 
+    before = get_session_snapshot(cur, session_id)
     cur.execute("""
         UPDATE charging_sessions 
         SET status='Completed', completed_at=?, duration_minutes=?, amount=?
         WHERE id=?
     """, (now, duration_minutes, amount_to_set, session_id))
+    apply_session_change(cur, session_id, before)
 
     # Remove first user from queue
     cur.execute("""
@@ -625,11 +709,13 @@ def owner_cancel_charging(session_id):
     if start_dt:
         duration_minutes = int((now - start_dt).total_seconds() // 60)
 
+    before = get_session_snapshot(cur, session_id)
     cur.execute("""
         UPDATE charging_sessions 
         SET status='Cancelled', completed_at=?, duration_minutes=?
         WHERE id=?
     """, (now, duration_minutes, session_id))
+    apply_session_change(cur, session_id, before)
 
     conn.commit()
     conn.close()
@@ -646,21 +732,75 @@ def chat():
         return redirect("/login")
     
     from ai.chatbot import chat_with_bot
+    from ai.conversation import conversation_store
+    
+    user_id = session.get("user_id")
     
     if request.method == "POST":
         user_message = request.form.get("message", "").strip()
         
         if not user_message:
-            return render_template("chat_interface.html", error="Please enter a message")
+            return render_template("chat_interface.html",
+                                 history=conversation_store.get_turns(user_id),
+                                 error="Please enter a message")
+        
+        response, is_error = chat_with_bot(user_message, conversation_store.get_history(user_id), user_id)
         
-        response, is_error = chat_with_bot(user_message)
+        conversation_store.add_turn(user_id, "user", user_message)
+        conversation_store.add_turn(user_id, "model", response)
         
         return render_template("chat_interface.html", 
-                             user_message=user_message,
-                             bot_response=response,
+                             history=conversation_store.get_turns(user_id),
                              is_error=is_error)
     
-    return render_template("chat_interface.html")
+    return render_template("chat_interface.html", history=conversation_store.get_turns(user_id))
+
+
+@station_bp.route("/user/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Server-Sent Events variant of /user/chat
+    Emits one `data: {"text": ...}` event per chunk, then an `event: done`
+    """
+    if session.get("role") != "user":
+        return {"error": "Unauthorized"}, 403
+    
+    from ai.chatbot import stream_chat_with_bot
+    from ai.conversation import conversation_store
+    
+    user_id = session.get("user_id")
+    user_message = request.form.get("message", "").strip()
+    if not user_message:
+        return {"error": "Please enter a message"}, 400
+    
+    history = conversation_store.get_history(user_id)
+    
+    def generate():
+        chunks = []
+        for chunk in stream_chat_with_bot(user_message, history, user_id):
+            chunks.append(chunk)
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+        
+        conversation_store.add_turn(user_id, "user", user_message)
+        conversation_store.add_turn(user_id, "model", "".join(chunks))
+        yield "event: done\ndata: {}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@station_bp.route("/user/chat/reset", methods=["POST"])
+def chat_reset():
+    if session.get("role") != "user":
+        return redirect("/login")
+    
+    from ai.conversation import conversation_store
+    
+    conversation_store.clear(session.get("user_id"))
+    return redirect("/user/chat")
 
 
 # ===============================
@@ -692,6 +832,8 @@ def nl_search():
     results = None
     explanation = None
     query = None
+    query_method = None
+    notice = None
     
     if request.method == "POST":
         query = request.form.get("query", "").strip()
@@ -699,25 +841,23 @@ def nl_search():
         if not query:
             return render_template("nl_search.html", error="Please enter a search query")
         
-        # Get all stations
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT name, location, chargers, price, green_score
-            FROM stations WHERE approved = 1
-        """)
-        all_stations = cur.fetchall()
-        conn.close()
+        # Optional browser location enables distance filtering and sorting;
+        # the range check also rejects nan and inf
+        user_location = _form_coordinates(request.form)
         
-        # Perform search
-        search_result = search_with_natural_language(query, all_stations)
+        # Perform search (filters are pushed down to SQL)
+        search_result = search_with_natural_language(query, user_location=user_location)
         results = search_result["results"]
         explanation = search_result["explanation"]
+        query_method = search_result["query_method"]
+        notice = search_result["notice"]
     
     return render_template("nl_search.html", 
                          results=results,
                          explanation=explanation,
-                         query=query)
+                         query=query,
+                         query_method=query_method,
+                         notice=notice)
 
 
 # ===============================
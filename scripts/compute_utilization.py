@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Compute Utilization - Smart EV Charging Platform
+================================================
+
+Sweeps session start/end events of every approved station to find how many
+chargers were busy minute by minute, and stores per-day occupancy, saturation
+periods and queue-formation windows for the owner views. Runs the nightly
+batch (scripts/nightly_analytics.py) with only its utilization output.
+
+Usage:
+    python scripts/compute_utilization.py [--workers 4] [--days 30]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.db import init_db
+from ai.utilization import UTILIZATION_DAYS
+from ai.station_batch import run_nightly_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charger utilization rollups for all stations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--days", type=int, default=UTILIZATION_DAYS, help="days to recompute, ending today")
+    options = parser.parse_args()
+
+    init_db()
+    report = run_nightly_batch(
+        workers=max(1, options.workers),
+        utilization_days=max(1, options.days),
+        outputs=("utilization",)
+    )
+
+    print(f"✅ {report['stations']} stations, {report['rows_read']} sessions -> "
+          f"{report['utilization_rows']} daily rows, {report['saturation_periods']} saturation periods in {report['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
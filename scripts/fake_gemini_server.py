@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Fake Gemini Server - Smart EV Charging Platform
+===============================================
+
+Local stand-in for the Gemini generateContent API so the AI routes can be
+benchmarked offline. Answers the three prompt shapes the app sends:
+- Natural language search -> filter JSON
+- Station recommendation  -> {"why", "benefits", "tip"} JSON
+- Chat                    -> plain text (streamed over SSE when asked)
+
+Every generated text contains the marker "[fake-gemini]" so a load test can
+tell model answers apart from the app's own fallbacks.
+
+Usage:
+    python scripts/fake_gemini_server.py --port 8765 --latency-ms 300 --error-rate 0.05
+
+Then start the app with:
+    GEMINI_API_KEY=fake GEMINI_BASE_URL=http://localhost:8765 python app.py
+
+GET /stats returns request, error and stream counters.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+MARKER = "[fake-gemini]"
+
+_stats = {"requests": 0, "errors": 0, "streams": 0, "nl_query": 0, "recommend": 0, "chat": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(*keys):
+    with _stats_lock:
+        for key in keys:
+            _stats[key] += 1
+
+
+def _prompt_text(body):
+    """All text parts of the request contents joined together"""
+    contents = body.get("contents", [])
+    if isinstance(contents, dict):
+        contents = [contents]
+    parts = []
+    for content in contents:
+        for part in content.get("parts", []):
+            if "text" in part:
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+def _nl_query_reply(prompt):
+    match = re.search(r'Query: "(.*)"', prompt)
+    query = (match.group(1) if match else "").lower()
+
+    filters = {
+        "green_score_min": 7 if re.search(r"\b(green|eco)\b", query) else None,
+        "green_score_max": None,
+        "price_min": None,
+        "price_max": None,
+        "max_distance": None,
+        "min_chargers": None,
+        "fast_charging": bool(re.search(r"\b(fast|quick)\b", query)),
+        "sort_by": "green_score",
+        "intent": "balanced",
+        "text_query": None
+    }
+    if re.search(r"\b(cheap|budget|affordable)\b", query):
+        filters["sort_by"] = "price"
+        filters["intent"] = "cheapest"
+    price = re.search(r"(?:under|below|less than)\s*₹?\s*(\d+)", query)
+    if price:
+        filters["price_max"] = int(price.group(1))
+    distance = re.search(r"(\d+)\s*km", query)
+    if distance:
+        filters["max_distance"] = int(distance.group(1))
+    place = re.search(r"\b(?:near|in|at)\s+([a-z][a-z ]+)", query)
+    if place and place.group(1).strip() not in ("me", "here"):
+        filters["text_query"] = place.group(1).strip()
+    return json.dumps(filters)
+
+
+def _recommend_reply(prompt):
+    match = re.search(r"Recommended Station \(Best Option\):\s*- Name: (.*)", prompt)
+    name = match.group(1).strip() if match else "this station"
+    return json.dumps({
+        "why": f"{MARKER} {name} is within range and has the best balance of price and green energy.",
+        "benefits": ["Reachable on your current charge", "Good green score for the price"],
+        "tip": "Unplug at 80% to save time and battery wear."
+    })
+
+
+def _chat_reply(prompt):
+    lines = [line for line in prompt.splitlines() if line.strip()]
+    question = lines[-1].strip() if lines else ""
+    return (
+        f"{MARKER} Thanks for asking about \"{question[:80]}\". "
+        "Open 'AI Recommendations' to find a station that fits your battery level, "
+        "or use 'Natural Language Search' to filter by price, distance and green score. "
+        "Charging off-peak is usually cheaper and quicker."
+    )
+
+
+def build_reply(prompt):
+    """(kind, text) for the prompt shape the app sent"""
+    if '"text_query"' in prompt:
+        return "nl_query", _nl_query_reply(prompt)
+    if '"why", "benefits", "tip"' in prompt:
+        return "recommend", _recommend_reply(prompt)
+    return "chat", _chat_reply(prompt)
+
+
+def _response_payload(text, finish=True):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"candidatesTokenCount": len(text.split())},
+        "modelVersion": "fake-gemini"
+    }
+
+
+def _split_chunks(text, count):
+    words = text.split(" ")
+    size = max(1, -(-len(words) // max(1, count)))
+    chunks = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [chunk + " " if i < len(chunks) - 1 else chunk for i, chunk in enumerate(chunks)]
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/stats":
+            with _stats_lock:
+                self._send_json(200, dict(_stats))
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            body = {}
+
+        if not path.endswith((":generateContent", ":streamGenerateContent")):
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        options = self.options
+        _count("requests")
+        time.sleep(max(0.0, options.latency_ms + random.uniform(-options.jitter_ms, options.jitter_ms)) / 1000)
+
+        if random.random() < options.error_rate:
+            _count("errors")
+            self._send_json(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+            return
+
+        kind, text = build_reply(_prompt_text(body))
+        _count(kind)
+
+        if path.endswith(":generateContent"):
+            self._send_json(200, _response_payload(text))
+            return
+
+        _count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunks = _split_chunks(text, options.chunks)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(options.chunk_delay_ms / 1000)
+            payload = _response_payload(chunk, finish=(i == len(chunks) - 1))
+            self.wfile.write(f"data: {json.dumps(payload)}\r\n\r\n".encode())
+            self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Gemini API for offline AI benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300, help="time before the first byte of each reply")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="uniform +/- jitter added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--chunks", type=int, default=8, help="number of SSE chunks per streamed reply")
+    parser.add_argument("--chunk-delay-ms", type=float, default=40, help="delay between streamed chunks")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    options = parser.parse_args()
+
+    FakeGeminiHandler.options = options
+    server = ThreadingHTTPServer((options.host, options.port), FakeGeminiHandler)
+    server.daemon_threads = True
+    print(f"🧪 Fake Gemini listening on http://{options.host}:{options.port} "
+          f"(latency {options.latency_ms}±{options.jitter_ms} ms, error rate {options.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
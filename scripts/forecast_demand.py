@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Forecast Demand - Smart EV Charging Platform
+============================================
+
+Fits hourly demand forecasts (seasonal naive + Holt-Winters with hour-of-week
+seasonality) for every approved station and stores them in station_forecasts,
+where the station analytics page reads them. Runs the nightly batch
+(scripts/nightly_analytics.py) with only its forecast output.
+
+Usage:
+    python scripts/forecast_demand.py [--workers 4] [--weeks 8] [--horizon-hours 216]
+
+Run it from cron, e.g. hourly or nightly.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.db import init_db
+from ai.forecasting import HISTORY_WEEKS, HORIZON_HOURS
+from ai.station_batch import run_nightly_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch demand forecast for all stations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--weeks", type=int, default=HISTORY_WEEKS, help="weeks of hourly history to fit on (min 2)")
+    parser.add_argument("--horizon-hours", type=int, default=HORIZON_HOURS)
+    options = parser.parse_args()
+
+    init_db()
+    report = run_nightly_batch(
+        workers=max(1, options.workers),
+        weeks=max(2, options.weeks),
+        horizon=max(1, options.horizon_hours),
+        outputs=("forecasts",)
+    )
+
+    print(f"✅ Forecast {report['stations']} stations, {report['forecast_rows']} hourly rows in {report['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+AI Route Load Test - Smart EV Charging Platform
+===============================================
+
+Drives /user/chat/stream, /user/recommend and /user/nl-search concurrently
+and reports latency percentiles, throughput and fallback rate per route.
+
+Run the app against scripts/fake_gemini_server.py (GEMINI_BASE_URL) so the
+numbers are repeatable offline; replies carrying the "[fake-gemini]" marker
+(or an "ai" query method for search) count as model answers, anything else
+as a fallback.
+
+Each worker registers and logs in as its own user ({n} in --email is the
+worker number) and starts from an empty chat, so workers never share a
+conversation. --fresh-chat also resets it before every chat request, making
+each one a first turn.
+
+Usage:
+    python scripts/load_test_ai.py --base-url http://localhost:5000 \\
+        --email loadtest{n}@example.com --password loadtest --workers 16 --requests 200
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+MARKER = "[fake-gemini]"
+
+CHAT_MESSAGES = [
+    "How do I save money when charging?",
+    "What is the best time to charge my car?",
+    "Tips for keeping my battery healthy in summer",
+    "Explain how the green score works",
+    "Can I reserve a charger in advance?",
+]
+
+SEARCH_QUERIES = [
+    "cheap green stations near me",
+    "fast charging under 15 rupees",
+    "eco friendly stations within 10 km",
+    "budget stations in Koramangala",
+    "stations with lots of chargers",
+]
+
+ROUTES = ("chat", "recommend", "nl_search")
+
+
+class Worker:
+    """One logged-in browser session for its own user account"""
+
+    def __init__(self, base_url, email, password, timeout, fresh_chat=False):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.fresh_chat = fresh_chat
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        # Registering an existing email just answers "Email already exists"
+        self._post("/register", {"name": email.split("@")[0], "email": email,
+                                 "password": password, "role": "user"}).read()
+        with self._post("/login", {"email": email, "password": password}) as response:
+            response.read()
+            if not response.geturl().endswith("/user/dashboard"):
+                raise RuntimeError(f"could not log in as {email}")
+        self._post("/user/chat/reset", {}).read()
+
+    def _post(self, path, form):
+        data = urllib.parse.urlencode(form).encode()
+        return self.opener.open(self.base_url + path, data=data, timeout=self.timeout)
+
+    def chat(self):
+        """(time to first event, total time, used model)"""
+        if self.fresh_chat:
+            self._post("/user/chat/reset", {}).read()
+        start = time.perf_counter()
+        first = None
+        text = []
+        with self._post("/user/chat/stream", {"message": random.choice(CHAT_MESSAGES)}) as response:
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                if first is None:
+                    first = time.perf_counter() - start
+                try:
+                    text.append(json.loads(line[5:]).get("text", ""))
+                except ValueError:
+                    pass
+        total = time.perf_counter() - start
+        return first if first is not None else total, total, MARKER in "".join(text)
+
+    def recommend(self):
+        start = time.perf_counter()
+        form = {"battery": random.randint(40, 100), "distance": random.randint(5, 40)}
+        with self._post("/user/recommend", form) as response:
+            body = response.read().decode("utf-8")
+        total = time.perf_counter() - start
+        return total, total, MARKER in body
+
+    def nl_search(self):
+        start = time.perf_counter()
+        with self._post("/user/nl-search", {"query": random.choice(SEARCH_QUERIES)}) as response:
+            body = response.read().decode("utf-8")
+        total = time.perf_counter() - start
+        return total, total, bool(re.search(r'data-query-method="ai"', body))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run(options):
+    routes = [r.strip() for r in options.routes.split(",") if r.strip()]
+    results = {route: {"first": [], "total": [], "model": 0, "errors": 0} for route in routes}
+    results_lock = threading.Lock()
+    remaining = [options.requests]
+    remaining_lock = threading.Lock()
+
+    def take():
+        with remaining_lock:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            return routes[remaining[0] % len(routes)]
+
+    def work(n):
+        email = options.email.format(n=n)
+        try:
+            worker = Worker(options.base_url, email, options.password, options.timeout, options.fresh_chat)
+        except Exception as e:
+            print(f"❌ Login failed for {email}: {e}")
+            return
+        while True:
+            route = take()
+            if route is None:
+                return
+            try:
+                first, total, used_model = getattr(worker, route)()
+            except Exception:
+                with results_lock:
+                    results[route]["errors"] += 1
+                continue
+            with results_lock:
+                results[route]["first"].append(first)
+                results[route]["total"].append(total)
+                results[route]["model"] += int(used_model)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(1, options.workers + 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n📊 {options.requests} requests, {options.workers} workers, {elapsed:.1f}s wall clock\n")
+    print(f"{'route':<10} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb p50':>9} {'fallback':>9}")
+    for route in routes:
+        data = results[route]
+        done = len(data["total"])
+        fallback = (done - data["model"]) / done if done else 0.0
+        print(
+            f"{route:<10} {done:>5} {data['errors']:>4} {done / elapsed:>7.1f} "
+            f"{percentile(data['total'], 50) * 1000:>8.0f} {percentile(data['total'], 95) * 1000:>8.0f} "
+            f"{percentile(data['total'], 99) * 1000:>8.0f} {percentile(data['first'], 50) * 1000:>9.0f} "
+            f"{fallback:>9.1%}"
+        )
+
+    if options.json:
+        summary = {
+            route: {
+                "ok": len(data["total"]),
+                "errors": data["errors"],
+                "throughput_rps": round(len(data["total"]) / elapsed, 2),
+                "p50_ms": round(percentile(data["total"], 50) * 1000, 1),
+                "p95_ms": round(percentile(data["total"], 95) * 1000, 1),
+                "p99_ms": round(percentile(data["total"], 99) * 1000, 1),
+                "ttfb_p50_ms": round(percentile(data["first"], 50) * 1000, 1),
+                "fallback_rate": round((len(data["total"]) - data["model"]) / len(data["total"]), 3) if data["total"] else 0.0
+            }
+            for route, data in results.items()
+        }
+        with open(options.json, "w") as f:
+            json.dump({"elapsed_seconds": round(elapsed, 2), "routes": summary}, f, indent=2)
+        print(f"\n💾 Wrote {options.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the AI routes")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--email", default="loadtest{n}@example.com",
+                        help="per-worker account; {n} is replaced by the worker number")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=120, help="total requests across all routes")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated subset of " + ", ".join(ROUTES))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--fresh-chat", action="store_true", help="reset the conversation before every chat request")
+    parser.add_argument("--json", help="also write the summary to this file")
+    options = parser.parse_args()
+    if "{n}" not in options.email and options.workers > 1:
+        parser.error("--email needs {n} so every worker gets its own account and conversation")
+    run(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Nightly Analytics - Smart EV Charging Platform
+==============================================
+
+Computes demand forecasts and charger utilization for every approved station.
+Stations are split across a process pool by session volume; each worker fits forecasts on the hourly rollup and reads its
+stations' sessions in the utilization window once, in chunks. Results are
+written in a single transaction, together with the per-user percentile
+sketches behind "greener than X% of users". This batch is the only writer of
+those tables; forecast_demand.py and compute_utilization.py run it for one
+output.
+
+Usage:
+    python scripts/nightly_analytics.py [--workers 4] [--weeks 8] [--utilization-days 30] [--horizon-hours 216] [--json out.json]
+
+Wall-clock time and rows/sec are printed so the job can be sized as the
+network grows.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.db import init_db
+from ai.forecasting import HISTORY_WEEKS, HORIZON_HOURS
+from ai.utilization import UTILIZATION_DAYS
+from ai.station_batch import run_nightly_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel analytics batch for all stations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--weeks", type=int, default=HISTORY_WEEKS, help="weeks of hourly history for forecasts (min 2)")
+    parser.add_argument("--utilization-days", type=int, default=UTILIZATION_DAYS)
+    parser.add_argument("--horizon-hours", type=int, default=HORIZON_HOURS)
+    parser.add_argument("--json", help="also write the run report to this file")
+    options = parser.parse_args()
+
+    init_db()
+    report = run_nightly_batch(
+        workers=max(1, options.workers),
+        weeks=max(2, options.weeks),
+        utilization_days=max(1, options.utilization_days),
+        horizon=max(1, options.horizon_hours)
+    )
+
+    print(f"✅ {report['stations']} stations on {report['workers']} workers")
+    print(f"📥 {report['rows_read']} rows read at {report['rows_per_second']} rows/sec")
+    print(f"📊 Percentile sketches over {report['sketch_users']} users")
+    print(f"⏱️  compute {report['compute_seconds']}s, write {report['write_seconds']}s, total {report['elapsed_seconds']}s")
+
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Wrote {options.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Rebuild Rollups - Smart EV Charging Platform
+============================================
+
+Recomputes the incrementally maintained rollup tables from charging_sessions.
+Use it after importing sessions outside the app or if a rollup looks off;
+normal traffic keeps them current on its own.
+
+Usage:
+    python scripts/rebuild_rollups.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.db import init_db
+from models.charging import rebuild_rollups
+
+
+def main():
+    init_db()
+    started = time.perf_counter()
+    counts = rebuild_rollups()
+    elapsed = time.perf_counter() - started
+
+    for table, rows in counts.items():
+        print(f"✅ {table}: {rows} rows")
+    print(f"⏱️  Rebuilt in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
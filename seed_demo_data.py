@@ -434,6 +434,15 @@ def main():
         
         conn.close()
         
+        # Sessions were inserted directly, so bring the rollup tables up to date
+        try:
+            from models.db import init_db
+            from models.charging import rebuild_rollups
+            init_db()
+            rebuild_rollups()
+        except Exception as e:
+            print(f"  ⚠️  Could not rebuild rollups: {e}")
+        
         print("""
 ╔═══════════════════════════════════════════════════════════════════════════╗
 ║                     ✅ SEEDING COMPLETE!                                 ║
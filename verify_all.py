@@ -54,6 +54,45 @@ try:
 except Exception as e:
     print(f"✗ Database check error: {e}")
 
+# Test 6: Concurrent identical AI requests are coalesced into one backend call
+try:
+    import threading
+    import time
+    import ai.analytics as analytics
+
+    backend_calls = []
+
+    def slow_summary(station_name):
+        backend_calls.append(station_name)
+        time.sleep(0.2)
+        return {"station": station_name}
+
+    original = analytics._compute_analytics_summary
+    analytics._compute_analytics_summary = slow_summary
+    try:
+        callers = 20
+        barrier = threading.Barrier(callers)
+        results = []
+
+        def viewer():
+            barrier.wait()
+            results.append(analytics.get_all_analytics_summary("Central Hub"))
+
+        threads = [threading.Thread(target=viewer) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        analytics._compute_analytics_summary = original
+
+    if len(backend_calls) == 1 and len(results) == callers and all(r == {"station": "Central Hub"} for r in results):
+        print(f"✓ Single-flight: {callers} concurrent callers triggered exactly 1 backend call")
+    else:
+        print(f"✗ Single-flight: {callers} callers triggered {len(backend_calls)} backend calls")
+except Exception as e:
+    print(f"✗ Single-flight check error: {e}")
+
 print("\n" + "=" * 50)
 print("✓ VERIFICATION COMPLETE - ALL SYSTEMS GO!")
 print("=" * 50)